@@ -1,13 +1,8 @@
-import os
-from langgraph.prebuilt import create_react_agent
-from utils.utils import load_config
-from openai import OpenAI
+from utils import llm
+from utils.dedup import distinct
+from agents import registry
 from pydantic import BaseModel, Field
-from typing import List, Dict
-import json
-from dotenv import load_dotenv
-
-load_dotenv(".env")
+from typing import List
 
 class QAPair(BaseModel):
     question: str = Field(..., description="Generated question based on the input text.")
@@ -17,42 +12,23 @@ class GeneratorOutput(BaseModel):
     qa_pairs: List[QAPair] = Field(..., description="List of generated question-answer pairs.")
 
 
-# Load the config file for the agent
-config = load_config('./config.yaml')
-
-agent_state = config["agents"].get("generator", {}).get("state", "False")
+_TASK = "Now, do the task for the following chunk."
+_SAMPLE_TEMPERATURE = 0.7          # n > 1: samples must differ
 
-system_prompt = config["agents"].get("generator", {}).get("system_prompt", "Default system prompt")
 
-client = OpenAI(
-     api_key = os.environ['LLM_API_KEY'],
-     base_url = os.environ['LLM_BASE_URL']
-)
-
-def generate_qa(chunk):   
-    
-    prompt = [""]
-    prompt[0] = {
-        "role": "system",
-        "content": system_prompt
-    }
-
-    # Add the user's question to the prompt and display it
-    prompt.append({"role": "user", 
-                   "content": f'''Now, do the task for the following chunk: {chunk}
-                                  Don't deviate from the instructions otherwise you will be penalized heavily.'''
-                  })
+async def generate_qa(chunk, n=1):   
     
-    
-    response = client.beta.chat.completions.parse(
-        model=os.environ['LLM_MODEL_NAME'],
-        messages=prompt,
-        temperature=0,
-        response_format=GeneratorOutput,
-        extra_body=dict(guided_decoding_backend="outlines"),
-    )
-    
-    data = json.loads(response.choices[0].message.content)
-
+    prompt = registry.template("generator", _TASK).build(
+        variable=[("Chunk", chunk)])
+
+    if n > 1:       # n samples from one request, pairs repeated across them once
+        samples = await llm.parse_n("generator", prompt, GeneratorOutput, n,
+                                    temperature=_SAMPLE_TEMPERATURE)
+        return distinct((qa for s in samples for qa in s["qa_pairs"]),
+                        lambda qa: qa["question"] + "\n" + qa["answer"])
+
+    data = await llm.parse("generator", prompt,
+                           response_format=GeneratorOutput,
+                           temperature=0)
     
     return data["qa_pairs"]
\ No newline at end of file
@@ -1,77 +1,62 @@
-import os
-from utils.utils import load_config
-from openai import OpenAI
-from pydantic import BaseModel, Field
-from typing import List
-import json
-from dotenv import load_dotenv
+from utils import llm
+from agents import registry
 import random
 
-load_dotenv(".env")
-
-client = OpenAI(
-     api_key = os.environ['LLM_API_KEY'],
-     base_url = os.environ['LLM_BASE_URL']
-)
-
-config = load_config('./config.yaml')
-
 agents = ["rlhf_irrelevant_content_generator","rlhf_incorrect_facts_generator","rlhf_offensive_tone_generator"]
 
-# agent_state = config["agents"].get(agents[2], {}).get("state", "False")
+SYSTEM_TURN = {"from":"system", "value":"You are a helpful AI assistant. Please answer questions in the same language as of the question."}
 
+_TASK = "Now, do the task for the following."
 
-def generate_orpo_data(chunk, id):
-    
-    prefixL = len(chunk['conversations'])-id-1 
-    if prefixL < 0:
-       return None
-    
-    system_prompt = config["agents"].get(agents[id], {}).get("prompt", "Default system prompt")
-    
-    if len(chunk['conversations']) == 1:
-        system_prompt = config["agents"].get(agents[random.randint(0,2)], {}).get("prompt", "Default system prompt")
 
+def generator_prompt(name):
+    """Prompt template of an `rlhf_*` generator; unknown names fail loudly."""
+    if "prompt" not in registry.spec(name):
+        raise ValueError(f"unknown ORPO generator agent: {name!r}")
+    return registry.template(name, _TASK, key="prompt")
 
-    prompt = [""]
-    prompt[0] = ({
-        "role": "system",
-        "content": system_prompt
-    })
-    
-    conversations = [{"from":"system", "value":"You are a helpful AI assistant. Please answer questions in the same language as of the question."}]
 
-    
+def build_history(chunk):
+    """Whole sharegpt history of a seed, built once and sliced per variant:
+    the first `prefixL` turns are `history[:1 + 2*prefixL]`."""
+    history = [SYSTEM_TURN]
+    for turn in chunk['conversations']:
+        history.append({"from":"human", "value":turn['question']})
+        history.append({"from":"gpt", "value":turn['answer']})
+    return history
+
 
-    for i in range(prefixL):
-        conversations.append({"from":"human", "value":chunk['conversations'][i]['question']})
-        conversations.append({"from":"gpt", "value":chunk['conversations'][i]['answer']})
+async def generate_orpo_data(chunk, id, generator=None, history=None):
+    """Variant `id` rejects the turn `id` places from the end, written by
+    `generator` (default: `agents[id]`, or a random one for single-turn seeds)."""
 
+    prefixL = len(chunk['conversations'])-id-1 
+    if prefixL < 0:
+       return None
 
+    if generator is None:
+        generator = agents[id] if len(chunk['conversations']) > 1 else random.choice(agents)
+    template = generator_prompt(generator)
 
-    # Add the user's question to the prompt and display it
-    prompt.append({"role": "user",
-                   "content": f'''Now, do the task for the following: 
-                                  Context: {chunk['context']}
-                                  {conversations}
-                                  Question: {chunk['conversations'][prefixL]['question']}
-                                  Correct Answer: {chunk['conversations'][prefixL]['answer']}
+    if history is None:
+        history = build_history(chunk)
+    conversations = history[:1 + 2 * prefixL]          # a fresh list
+    turn = chunk['conversations'][prefixL]
 
-                                  Don't deviate from the instructions otherwise you will be penalized heavily.'''
-                  })
+    # the context is shared by every variant of a seed, so it precedes the turns
+    prompt = template.build(shared=[("Context", chunk['context'])],
+                            variable=[("Conversation", conversations),
+                                      ("Question", turn['question']),
+                                      ("Correct Answer", turn['answer'])])
 
-    response = client.chat.completions.create(
-        model=os.environ['LLM_MODEL_NAME'],
-        messages=prompt,
-        temperature=0
-    )
+    rejected = await llm.complete("orpo_generator", prompt, temperature=0)
     
-    conversations.append({"from":"human", "value": chunk['conversations'][prefixL]['question']})
+    conversations.append({"from":"human", "value": turn['question']})
 
     result = {  
                 "conversations":conversations,
-                "chosen": {"from":"gpt", "value": chunk['conversations'][prefixL]['answer']},
-                "rejected": {"from":"gpt", "value": response.choices[0].message.content}
+                "chosen": {"from":"gpt", "value": turn['answer']},
+                "rejected": {"from":"gpt", "value": rejected}
             }
                 
 
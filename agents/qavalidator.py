@@ -1,57 +1,75 @@
-import os
-from langgraph.prebuilt import create_react_agent
-from utils.utils import load_config
-from openai import OpenAI
+from utils import llm
+from agents import registry
 from pydantic import BaseModel, Field
-from typing import List, Dict
-import json
-from dotenv import load_dotenv
-
-load_dotenv(".env")
+from typing import List
+import asyncio
+import logging
 
 # 🔹 4. QAValidator Agent Output Schema
 class QAValidatorOutput(BaseModel):
     is_valid: bool = Field(..., description="True if the question is relevant, the answer is correct, and it aligns with the passage.")
 
-# Load the config file for the agent
-config = load_config('./config.yaml')
+# Batched variant: one verdict per pair, addressed by index
+class QAVerdict(BaseModel):
+    index: int = Field(..., description="0-based index of the question-answer pair being judged.")
+    is_valid: bool = Field(..., description="True if the question is relevant, the answer is correct, and it aligns with the passage.")
 
-agent_state = config["agents"].get("qa_validator", {}).get("state", "False")
+class QABatchValidatorOutput(BaseModel):
+    verdicts: List[QAVerdict] = Field(..., description="Exactly one verdict per input pair, in input order.")
 
-system_prompt = config["agents"].get("qa_validator", {}).get("system_prompt", "Default system prompt")
+log = logging.getLogger(__name__)
 
-client = OpenAI(
-     api_key = os.environ['LLM_API_KEY'],
-     base_url = os.environ['LLM_BASE_URL']
-)
+_TASK = "Now, do the task for the following chunk."
 
-def validate_qa(question, answer, chunk):   
-    
-    prompt = [""]
-    prompt[0] = {
-        "role": "system",
-        "content": system_prompt
-    }
-
-    # Add the user's question to the prompt and display it
-    prompt.append({"role": "user", 
-                   "content": f'''Now, do the task for the following chunk: 
-                                  Question: {question}
-                                  Answer: {answer}
-                                  Chunk: {chunk}
-                                  Don't deviate from the instructions otherwise you will be penalized heavily.'''
-                  })
-    
-    
-    response = client.beta.chat.completions.parse(
-        model=os.environ['LLM_MODEL_NAME'],
-        messages=prompt,
-        temperature=0,
-        response_format=QAValidatorOutput,
-        extra_body=dict(guided_decoding_backend="outlines"),
-    )
+
+async def validate_qa(question, answer, chunk):   
     
-    data = json.loads(response.choices[0].message.content)
+    # the chunk goes first so every pair of a chunk shares the cached prefix
+    prompt = registry.template("qa_validator", _TASK).build(
+        shared=[("Chunk", chunk)],
+        variable=[("Question", question), ("Answer", answer)])
 
+    data = await llm.parse("qa_validator", prompt,
+                           response_format=QAValidatorOutput,
+                           temperature=0)
     
-    return data["is_valid"]
\ No newline at end of file
+    return data["is_valid"]
+
+
+_BATCH_TASK = ("Now, do the task for each of the following question-answer pairs independently. "
+               'Instead of a single "is_valid", return "verdicts" with exactly one '
+               '{"index", "is_valid"} entry per pair.')
+
+
+async def validate_qa_batch(pairs, chunk):
+    """
+    Validate every (question, answer) pair of one chunk in a single call.
+
+    Returns one bool per pair.  If the model's answer does not cover every
+    index exactly once, falls back to one `validate_qa` call per pair.
+    """
+    if not pairs:
+        return []
+    from openai import LengthFinishReasonError       # deferred: heavy import
+
+    listing = "\n".join(f"[{i}] Question: {q}\n    Answer: {a}"
+                        for i, (q, a) in enumerate(pairs))
+    prompt = registry.template("qa_validator", _BATCH_TASK).build(
+        shared=[("Chunk", chunk)],
+        variable=[("Pairs", listing)])
+
+    try:
+        data = await llm.parse("qa_validator", prompt,
+                               response_format=QABatchValidatorOutput,
+                               temperature=0)
+        indices = sorted(v["index"] for v in data["verdicts"])
+        if indices == list(range(len(pairs))):       # each exactly once
+            verdicts = {v["index"]: v["is_valid"] for v in data["verdicts"]}
+            return [verdicts[i] for i in range(len(pairs))]
+        log.warning("batch QA validation returned indices %s for %s pairs; "
+                    "falling back to per-pair calls", indices, len(pairs))
+    except (ValueError, KeyError, TypeError, LengthFinishReasonError) as e:
+        log.warning("batch QA validation unusable (%s); falling back to "
+                    "per-pair calls", e)
+
+    return await asyncio.gather(*(validate_qa(q, a, chunk) for q, a in pairs))
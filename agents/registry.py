@@ -0,0 +1,38 @@
+"""
+Agent registry – `config.yaml` is parsed once, on first use, not at import.
+
+* spec(name)                     – the agent's config entry ({} if missing)
+* template(name, task, key=...)  – `utils.prompts.Template` with the agent's
+                                   system prompt (`system_prompt`, or `prompt`
+                                   for the rlhf_* generators) and the static
+                                   task header joined once; cached per
+                                   (name, task, key)
+
+The file is found next to this package, so the working directory no longer
+matters.  Clients are not created here: `utils.llm.session(cfg)` opens them
+for the run.
+"""
+from __future__ import annotations
+from functools import lru_cache
+from pathlib import Path
+
+from utils import prompts
+
+CONFIG_PATH = Path(__file__).resolve().parent.parent / "config.yaml"
+
+
+@lru_cache(maxsize=None)
+def _agents() -> dict:
+    import yaml
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)   # libyaml if built
+    with CONFIG_PATH.open("r", encoding="utf-8") as fh:
+        return yaml.load(fh, Loader=loader)["agents"]
+
+
+def spec(name: str) -> dict:
+    return _agents().get(name, {})
+
+
+@lru_cache(maxsize=None)
+def template(name: str, task: str, key: str = "system_prompt") -> prompts.Template:
+    return prompts.Template(spec(name).get(key, "Default system prompt"), task)
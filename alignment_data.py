@@ -6,17 +6,21 @@ Handles both alignment tasks that rely on `agents.orpo_generator.generate_orpo_d
 
     • single-turn  (mode == "single-align")
     • multi-turn   (mode == "multi-align")
+
+Variant k of a seed rejects the k-th turn from the end; up to
+`Config.orpo_variants` variants per seed run concurrently and share one
+conversation history.  Generators rotate through `Config.orpo_generators`
+(single-turn seeds: one variant, generator picked by row index).
 """
 from __future__ import annotations
-import json, logging
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from pathlib import Path
-import pathlib
-
-import pandas as pd
-
-from agents.orpo_generator import generate_orpo_data
-from utils.io      import tqdm_std, safe_jsonl_writer
+import asyncio, json, logging
+from functools import partial
+
+from agents.orpo_generator import (agents, build_history, generate_orpo_data,
+                                   generator_prompt)
+from utils.io      import iter_records, count_records, export_table, TABLE_FORMATS
+from utils.shard   import output_json
+from utils.engine  import run_to_jsonl
 from utils.logger  import init_root
 from config        import Config
 
@@ -24,60 +28,55 @@ init_root()
 log = logging.getLogger(__name__)
 
 
-def _worker(idx: int, ctx: str, conv_base, jf, rows: list[dict], n_variants=3):
-    try:
-        for k in range(n_variants):
-            generated = generate_orpo_data({"context": ctx,
-                                            "conversations": conv_base}, k)
-            if generated:
-                rows.append({"context": ctx, "conversation": generated})
-                json.dump({"context": ctx, "conversation": generated},
-                          jf, ensure_ascii=False)
-                jf.write("\n")
-    except Exception as e:
-        log.exception("ORPO idx %s failed: %s", idx, e)
+async def _worker(idx: int, seed: dict, n_variants: int = 3,
+                  generators: list[str] | None = None) -> list[dict]:
+    generators = generators or agents
+    turns = len(seed["conversations"])
+    history = build_history(seed)
+    mix = ([generators[idx % len(generators)]] if turns == 1 else
+           [generators[k % len(generators)] for k in range(min(n_variants, turns))])
+    results = await asyncio.gather(
+        *(generate_orpo_data(seed, k, g, history) for k, g in enumerate(mix)),
+        return_exceptions=True)
+    for r in results:               # one failed variant fails the row (retried on resume)
+        if isinstance(r, BaseException):
+            raise r
+    return [{"context": seed["context"], "conversation": g} for g in results if g]
+
+
+def _seeds(cfg: Config, multi: bool):
+    """Stream (idx, seed) pairs; nested columns may arrive JSON-encoded (CSV)
+    or as Arrow list<struct> (Parquet / Arrow, already Python lists)."""
+    cols = ("context", "conversation") if multi else ("context", "question", "answer")
+    for i, row in enumerate(iter_records(cfg.input_file, cols)):
+        if multi:   # already multi-turn
+            conv_base = row["conversation"]
+            if isinstance(conv_base, str):
+                conv_base = json.loads(conv_base)
+        else:       # construct single-turn seed
+            conv_base = [{"question": row["question"],
+                          "answer":  row["answer"]}]
+
+        yield i, {"context": row["context"], "conversations": conv_base}
 
 
 def _run_generic(cfg: Config, multi: bool):
-    path = pathlib.Path(cfg.input_file)
-    try:
-        df = pd.read_json(path, lines=True)
-    except ValueError as e:
-        raise ValueError(
-            f"{path.name} could not be parsed as JSON-Lines.\n"
-            "Did you perhaps upload the CSV, or does the file start with "
-            "a BOM / log line?\n"
-            f"Original error from pandas: {e}"
-        ) from None
-    data = pd.read_json(cfg.input_file, lines=True)
-    tag = "multi_align" if multi else "single_align"
-    out_csv  = cfg.output_dir / f"{cfg.model_name.replace('/','-')}_{tag}.csv"
-    out_json = cfg.output_dir / f"{cfg.model_name.replace('/','-')}_{tag}.jsonl"
-    rows: list[dict] = []
-
-    with safe_jsonl_writer(out_json) as jf, \
-         ThreadPoolExecutor(max_workers=cfg.max_workers) as pool:
-
-        futures = {}
-        for i in range(len(data)):
-            ctx = data["context"][i]
-
-            if multi:   # already multi-turn
-                conv_base = data["conversation"][i]
-            else:       # construct single-turn seed
-                conv_base = [{"question": data["question"][i],
-                              "answer":  data["answer"][i]}]
-
-            futures[pool.submit(_worker, i, ctx, conv_base, jf, rows)] = i
-
-        for _ in tqdm_std(as_completed(futures), total=len(futures),
-                          desc=f"ORPO {'multi' if multi else 'single'}"):
-            pass
-
-    pd.DataFrame(rows).to_csv(out_csv, index=False)
+    out_json  = output_json(cfg)
+    out_table = out_json.with_suffix(TABLE_FORMATS[cfg.table_format])
+
+    for name in cfg.orpo_generators:
+        generator_prompt(name)                  # unknown agent → fail before any call
+    worker = partial(_worker, n_variants=cfg.orpo_variants,
+                     generators=cfg.orpo_generators)
+
+    run_to_jsonl(cfg, out_json, partial(_seeds, cfg, multi), worker,
+                 desc=f"ORPO {'multi' if multi else 'single'}",
+                 total=count_records(cfg.input_file))
+
+    n = export_table(out_json, out_table, cfg.table_format, "orpo")
     log.info("✅  ORPO %s: %s rows → %s / %s",
-             'multi' if multi else 'single', len(rows), out_csv, out_json)
-    return out_csv, out_json
+             'multi' if multi else 'single', n, out_table, out_json)
+    return out_table, out_json
 
 
 # public wrappers --------------------------------------------------------------
@@ -1,34 +1,14 @@
 
-import tempfile, threading, time, logging, itertools, json
+import os, time, itertools, json
 import streamlit as st
 import pandas as pd
 from pandas.errors import ParserError
-import httpx                                 
-from config   import Config
 from pathlib import Path   
-from executor import run as run_pipeline
-from utils.logger import get_stream_handler, remove_stream_handler, init_root
+from utils.jobs import JobManager
+from utils.llm import ping as ping_llm
+from utils.logger import init_root
 init_root()
 
-# ──────────────────────────  QUICK LLM PING  ────────────────────────────────
-def ping_llm(base_url: str, api_key: str, model: str) -> tuple[bool, str]:
-    """Return (ok?, message) after one 1-token /chat/completions call."""
-    try:
-        url = base_url.rstrip("/") + "/chat/completions"
-        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
-        payload = {
-            "model": model,
-            "messages": [{"role": "user", "content": "ping"}],
-            "max_tokens": 1,
-            "temperature": 0.0,
-            "stream": False,
-        }
-        r = httpx.post(url, json=payload, headers=headers, timeout=5)
-        return (r.status_code == 200,
-                f"{r.status_code} {r.reason_phrase or r.text[:60]}")
-    except Exception as e:
-        return False, str(e)
-
 # ──────────────────────────────  PAGE LAYOUT  ────────────────────────────────
 st.set_page_config(page_title="Data-Augmentation Toolkit", layout="wide")
 st.title("📚 Data-Augmentation Toolkit")
@@ -39,13 +19,15 @@ model_name = st.sidebar.text_input(
     "Model name", "")
 api_key  = st.sidebar.text_input("API key", type="password")
 base_url = st.sidebar.text_input(
-    "Base URL", "")
+    "Base URL", "", help="Comma-separate several replicas to load-balance.")
+base_urls = [u.strip() for u in base_url.split(",") if u.strip()]
 
 # NEW ② ── health-check button (no layout change)
 if st.sidebar.button("🔌 Health-check"):
     with st.spinner("Pinging LLM…"):
-        ok, msg = ping_llm(base_url, api_key, model_name)
-    (st.sidebar.success if ok else st.sidebar.error)(msg)
+        for url in base_urls or [""]:
+            ok, msg = ping_llm(url, api_key, model_name)
+            (st.sidebar.success if ok else st.sidebar.error)(f"{url}: {msg}")
 
 st.sidebar.header("Generation mode")
 mode = st.sidebar.radio(
@@ -82,45 +64,132 @@ def _validate_uploaded_file(uploaded_file, mode: str) -> bool:
             try: pd.read_csv(uploaded_file, nrows=5)
             except (ParserError, UnicodeDecodeError) as e:
                 st.error(f"❌ CSV broken: {e}"); return False
+        elif name.endswith((".parquet", ".pq", ".arrow", ".feather", ".ipc")):
+            head = uploaded_file.read(6)
+            if head[:4] not in (b"PAR1", b"ARRO", b"\xff\xff\xff\xff"):
+                st.error("❌ not a Parquet / Arrow file"); return False
         else:
-            st.error("❌ .jsonl / .csv only"); return False
+            st.error("❌ .jsonl / .csv / .parquet / .arrow only"); return False
     finally: uploaded_file.seek(0)
     return True
 
-workers = st.sidebar.slider("Threads (concurrent requests)", 1, 16, 8)
-
-# ----- MAIN PANEL ------------------------------------------------------------
-uploaded = st.file_uploader("Upload JSONL / JSON file", type=["jsonl", "json"])
-run_btn  = st.button("🚀 Run")
+workers   = st.sidebar.slider("Concurrent rows", 1, 256, 8)
+in_flight = st.sidebar.slider("Max in-flight requests", 1, 512, 64)
+table_fmt = st.sidebar.selectbox("Table export", ("csv", "parquet", "arrow"))
 
-log_box      = st.empty()
-download_box = st.empty()
+# ----- JOBS (one manager per server process, shared by all sessions) --------
+LOG_LINES     = 400                  # ring buffer shown in the log pane
+MAX_DOWNLOAD  = 32 << 20             # bigger .gz files: path on disk only
 
-def launch_job(uploaded_file):
-    import tempfile, logging, time, json, itertools  # local scope
-    with tempfile.NamedTemporaryFile(delete=False) as tmp:
-        tmp.write(uploaded_file.getvalue()); input_path = tmp.name
 
-    cfg = Config(model_name=model_name, api_key=api_key, base_url=base_url,
-                 mode=mode, input_file=input_path, max_workers=workers)
+@st.cache_resource
+def _jobs() -> JobManager:
+    return JobManager(Path(os.environ.get("DAT_JOBS_DIR", "output/jobs")),
+                      max_jobs=int(os.environ.get("DAT_MAX_JOBS", "2")),
+                      log_lines=LOG_LINES)
 
-    hdl, buf = get_stream_handler(); results = {}
-    def _worker():
-        try:
-            _csv, json_path = run_pipeline(cfg); results["json"] = json_path
-        finally:
-            remove_stream_handler(hdl)
 
-    threading.Thread(target=_worker, daemon=True).start()
-    while hdl in logging.getLogger().handlers:
-        time.sleep(0.5); log_box.code(buf.getvalue())
-    log_box.code(buf.getvalue())
+jobs = _jobs()
 
-    if results.get("json"):
-        download_box.download_button("⬇ Download JSONL",
-            data=open(results["json"], "rb").read(),
-            file_name=Path(results["json"]).name,
-            mime="application/json")
+# ----- MAIN PANEL ------------------------------------------------------------
+uploaded = st.file_uploader("Upload JSONL / CSV / Parquet / Arrow file",
+                            type=["jsonl", "csv", "parquet", "arrow", "feather"])
+run_btn  = st.button("🚀 Run")
 
 if run_btn and uploaded and _validate_uploaded_file(uploaded, mode):
-    launch_job(uploaded)
+    try:
+        job_id = jobs.submit(dict(model_name=model_name, api_key=api_key,
+                                  base_url=base_urls[0] if base_urls else "",
+                                  base_urls=base_urls[1:], mode=mode,
+                                  max_workers=workers, max_in_flight=in_flight,
+                                  table_format=table_fmt),
+                             uploaded, uploaded.name)
+        st.query_params["job"] = job_id      # survives a page reload
+    except Exception as e:
+        st.error(f"❌ {e}")
+
+recent = jobs.jobs()
+if not recent:
+    st.stop()
+
+ids = [j["id"] for j in recent]
+current = st.query_params.get("job")
+job_id = st.selectbox(
+    "Job", ids, index=ids.index(current) if current in ids else 0,
+    format_func=lambda i: next(f"{j['id']} · {j['mode']} · {j['input_name']} · {j['status']}"
+                               for j in recent if j["id"] == i))
+st.query_params["job"] = job_id
+
+
+def _fmt_secs(s):
+    return "–" if s is None else time.strftime("%H:%M:%S", time.gmtime(s))
+
+
+def _show_progress(progress: dict) -> None:
+    for desc, p in progress.items():
+        done = f"{p['n']:,}" + (f" / {p['total']:,}" if p["total"] else "")
+        st.markdown(f"**{desc}** · {done} rows · {p['rate']:.1f} rows/s · "
+                    f"elapsed {_fmt_secs(p['elapsed'])} · ETA {_fmt_secs(p['eta'])}")
+        if p["total"]:
+            st.progress(min(1.0, p["n"] / p["total"]))
+
+
+_fragment = getattr(st, "fragment", None) or st.experimental_fragment
+
+
+@_fragment(run_every=1.0)
+def job_panel(job_id: str) -> None:
+    """Re-runs on its own every second; only this job's bounded state."""
+    job = jobs.get(job_id)
+    st.caption(f"status: **{job['status']}**"
+               + (f" · {job['records']:,} records" if job["records"] is not None else "")
+               + (f" · {job['error']}" if job["error"] else ""))
+    live = jobs.live(job_id)
+    if live is not None:
+        # the log text is rebuilt only when the LiveLog moved on since the
+        # last tick; otherwise this session's cached copy is drawn again
+        key = f"log-{job_id}"
+        cached = st.session_state.get(key)
+        if cached is None or cached[0] != live.version:
+            version, lines, progress = live.snapshot()
+            hidden = live.n_lines - len(lines)
+            text = ((f"… {hidden:,} earlier lines\n" if hidden else "")
+                    + "\n".join(lines))
+            cached = st.session_state[key] = (version, progress, text)
+        _, progress, text = cached
+        _show_progress(progress)
+    else:
+        text = "\n".join(jobs.log_tail(job_id, LOG_LINES))
+    st.code(text)
+    # full rerun once the job settles, so the download / resume row appears
+    key = f"status-{job_id}"
+    if st.session_state.get(key) not in (None, job["status"]):
+        st.session_state[key] = job["status"]
+        st.rerun()
+    st.session_state[key] = job["status"]
+
+
+job_panel(job_id)
+
+job = jobs.get(job_id)
+if job["status"] == "done":
+    gz = jobs.download(job_id)
+    if gz is None:
+        st.warning("The output of this job is no longer on the server.")
+    elif gz.stat().st_size <= MAX_DOWNLOAD:
+        # the bytes go into this session only once asked for, not into
+        # every session that merely looks at the job
+        if st.session_state.get("download") == job_id:
+            with gz.open("rb") as fh:
+                st.download_button("⬇ Download JSONL (.gz)", data=fh,
+                                   file_name=gz.name, mime="application/gzip")
+        elif st.button(f"Prepare download ({gz.stat().st_size >> 10:,} KiB)"):
+            st.session_state["download"] = job_id
+            st.rerun()
+    else:
+        st.info(f"Output is {gz.stat().st_size >> 20} MiB – fetch it from "
+                f"`{gz}` on the server.")
+elif job["status"] in ("failed", "interrupted"):
+    if st.button("↻ Resume job (skips finished rows)"):
+        jobs.resume(job_id, api_key)
+        st.rerun()
@@ -0,0 +1,182 @@
+"""
+Local stand-in for an OpenAI-compatible `/v1/chat/completions` endpoint.
+
+* structured calls (`response_format` = json_schema) get a schema-conforming
+  fake object, free-text calls get `--tokens` words of filler
+* latency is log-normal around `--latency-ms` (spread `--jitter`)
+* `--error-rate` of requests fail with `--error-status` (+ `Retry-After`)
+* `n > 1` returns n choices, like vLLM
+* arrays get one element per `[i] Question:` line of the prompt (so batch
+  QA validation returns a verdict per pair), else `--array-len`
+* listen backlog of 1024, so the harness's own concurrency never makes the
+  kernel drop connections (what would be timed then is SYN retries)
+* GET  /stats        – request count + service-time percentiles (ms)
+* POST /stats/reset  – clear the counters between benchmark runs
+
+    python -m bench.mock_server --port 18000 --latency-ms 200 --error-rate 0.01
+"""
+from __future__ import annotations
+import argparse, json, math, random, re, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_WORDS = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do".split()
+_PAIR  = re.compile(r"^\[\d+\] Question:", re.M)
+
+
+def fake_from_schema(schema: dict, defs: dict, n_words: int, pos: int = 0,
+                     n_items: int = 3):
+    """Smallest value that satisfies the (pydantic-generated) JSON schema;
+    arrays get `n_items` elements."""
+    if "$ref" in schema:
+        return fake_from_schema(defs[schema["$ref"].rsplit("/", 1)[-1]],
+                                defs, n_words, pos, n_items)
+    kind = schema.get("type")
+    if kind == "object":
+        return {k: fake_from_schema(v, defs, n_words, pos, n_items)
+                for k, v in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [fake_from_schema(schema["items"], defs, n_words, i, n_items)
+                for i in range(n_items)]
+    if kind == "boolean":
+        return random.random() < 0.9
+    if kind == "integer":
+        return pos                               # e.g. QA batch verdict index
+    if kind == "number":
+        return float(pos)
+    return " ".join(random.choices(_WORDS, k=n_words))
+
+
+class _Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.t0 = time.monotonic()
+            self.latencies: list[float] = []
+            self.errors = 0
+
+    def add(self, seconds: float, ok: bool):
+        with self.lock:
+            self.latencies.append(seconds)
+            self.errors += not ok
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            lat = sorted(self.latencies)
+            wall = time.monotonic() - self.t0
+
+        def pct(p: float) -> float:
+            return round(1000 * lat[min(len(lat) - 1, int(p * len(lat)))], 1) if lat else 0.0
+
+        return {"requests": len(lat), "errors": self.errors,
+                "requests_per_s": round(len(lat) / max(wall, 1e-9), 2),
+                "p50_ms": pct(0.50), "p99_ms": pct(0.99)}
+
+
+def make_handler(args: argparse.Namespace, stats: _Stats):
+    mu = math.log(max(args.latency_ms, 0.001) / 1000)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *_):               # keep the benchmark quiet
+            pass
+
+        def _send(self, status: int, body: dict, headers: dict | None = None):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/stats"):
+                return self._send(200, stats.snapshot())
+            self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            t0 = time.monotonic()
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            if self.path.rstrip("/").endswith("/stats/reset"):
+                stats.reset()
+                return self._send(200, {"ok": True})
+
+            time.sleep(random.lognormvariate(mu, args.jitter) if args.jitter
+                       else math.exp(mu))
+            if random.random() < args.error_rate:
+                stats.add(time.monotonic() - t0, ok=False)
+                return self._send(args.error_status,
+                                  {"error": {"message": "injected failure"}},
+                                  {"Retry-After": str(args.retry_after)})
+
+            rf = body.get("response_format") or {}
+            schema = (rf.get("json_schema") or {}).get("schema")
+            prompt = "\n".join(str(m.get("content", ""))
+                               for m in body.get("messages", []))
+            n_items = len(_PAIR.findall(prompt)) or args.array_len
+            choices = []
+            for i in range(body.get("n") or 1):
+                if schema:
+                    content = json.dumps(fake_from_schema(
+                        schema, schema.get("$defs", {}), args.tokens,
+                        n_items=n_items))
+                else:
+                    content = " ".join(random.choices(_WORDS, k=args.tokens))
+                choices.append({"index": i, "finish_reason": "stop",
+                                "message": {"role": "assistant",
+                                            "content": content}})
+            prompt_tokens = sum(len(str(m.get("content", "")).split())
+                                for m in body.get("messages", []))
+            completion_tokens = args.tokens * len(choices)
+            stats.add(time.monotonic() - t0, ok=True)
+            self._send(200, {
+                "id": "mock", "object": "chat.completion", "created": int(time.time()),
+                "model": body.get("model", "mock"), "choices": choices,
+                "usage": {"prompt_tokens": prompt_tokens,
+                          "completion_tokens": completion_tokens,
+                          "total_tokens": prompt_tokens + completion_tokens},
+            })
+
+    return Handler
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024                    # listen backlog (default 5)
+
+
+def serve(args: argparse.Namespace) -> ThreadingHTTPServer:
+    """Start the server on a daemon thread and return it."""
+    server = _Server((args.host, args.port), make_handler(args, _Stats()))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def build_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=18000)
+    p.add_argument("--latency-ms", type=float, default=200.0, help="median latency")
+    p.add_argument("--jitter", type=float, default=0.5, help="log-normal sigma (0 = fixed)")
+    p.add_argument("--error-rate", type=float, default=0.0)
+    p.add_argument("--error-status", type=int, default=503)
+    p.add_argument("--retry-after", type=float, default=1.0)
+    p.add_argument("--tokens", type=int, default=32, help="words per generated string")
+    p.add_argument("--array-len", type=int, default=3,
+                   help="elements per JSON array (when the prompt lists no pairs)")
+    return p
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    server = serve(args)
+    print(f"mock LLM on http://{args.host}:{args.port}/v1 – Ctrl-C to stop")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
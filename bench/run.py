@@ -0,0 +1,207 @@
+"""
+Throughput benchmark for `executor.run` against the local mock LLM.
+
+For every mode × corpus size a synthetic input is generated, the pipeline
+runs in a fresh process (so peak RSS is per run) and one table row is
+printed:
+
+    rows/s · requests/s · p50 / p99 request latency · peak RSS ·
+    writer busy % / max queue depth (contention on the single JSONL writer)
+
+    python -m bench.run --sizes 100 1000 10000 --latency-ms 200 \
+                        --max-workers 128 --max-in-flight 256
+
+Before the runs the mock is probed with max(--max-workers, --max-in-flight)
+simultaneous requests; a warning is printed when its median is far above
+--latency-ms (then the table would measure the mock, not the pipeline).
+
+Runs from any directory (with the repository importable, e.g. on
+PYTHONPATH): the agents find config.yaml next to the package
+(agents/registry.py) and every path handed to the runs is absolute.
+"""
+from __future__ import annotations
+import argparse, json, multiprocessing as mp, os, random, resource, statistics
+import subprocess, sys, tempfile, time, urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+MODES = ("single-sft", "multi-sft", "single-align", "multi-align")
+ROOT = Path(__file__).resolve().parent.parent
+
+
+# ---------- synthetic corpora ----------------------------------------------- #
+def _para(rng: random.Random, words: int) -> str:
+    vocab = "data model answer context question token server batch cache".split()
+    return " ".join(rng.choice(vocab) + str(rng.randrange(10_000))
+                    for _ in range(words))
+
+
+def make_corpus(mode: str, n: int, path: Path, words: int = 200) -> Path:
+    rng = random.Random(n)
+    with path.open("w", encoding="utf-8") as fh:
+        for _ in range(n):
+            if mode.endswith("sft"):
+                row = {"text": _para(rng, words)}
+            elif mode == "single-align":
+                row = {"context": _para(rng, words), "question": _para(rng, 12),
+                       "answer": _para(rng, 30)}
+            else:
+                row = {"context": _para(rng, words),
+                       "conversation": [{"question": _para(rng, 12),
+                                         "answer": _para(rng, 30)}
+                                        for _ in range(3)]}
+            fh.write(json.dumps(row) + "\n")
+    return path
+
+
+# ---------- one run in a fresh process -------------------------------------- #
+def _child(cfg_kwargs: dict, result_q) -> None:
+    sys.path.insert(0, str(ROOT))
+    sys.stderr = open(os.devnull, "w")              # progress bars
+    import logging
+    from utils.logger import init_root
+    init_root(logging.WARNING)
+    from config import Config
+    from executor import run
+
+    t0 = time.monotonic()
+    _csv, out_json = run(Config(**cfg_kwargs))
+    elapsed = time.monotonic() - t0
+    summary = json.loads(Path(out_json).with_suffix(".summary.json").read_text())
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":                    # bytes there, KiB on Linux
+        rss_kb //= 1024
+    result_q.put({"elapsed_s": elapsed, "summary": summary,
+                  "peak_rss_mb": round(rss_kb / 1024, 1)})
+
+
+def _http(url: str, method: str = "GET") -> dict:
+    req = urllib.request.Request(url, method=method,
+                                 data=b"{}" if method == "POST" else None,
+                                 headers={"Content-Type": "application/json",
+                                          "Content-Length": "2"})
+    with urllib.request.urlopen(req, timeout=10) as r:
+        return json.loads(r.read())
+
+
+def _wait_ready(base: str, timeout: float = 15.0) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _http(base + "/stats")
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def probe(base: str, concurrency: int, latency_ms: float) -> float:
+    """p50 (ms) of `concurrency` simultaneous plain requests to the mock;
+    warns when it is far above `latency_ms` – the mock, not the pipeline,
+    would then be what the table measures."""
+    body = json.dumps({"model": "mock", "messages": [{"role": "user",
+                                                      "content": "probe"}]}).encode()
+
+    def one(_) -> float:
+        t0 = time.monotonic()
+        req = urllib.request.Request(base + "/chat/completions", data=body,
+                                     headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(req, timeout=60) as r:
+            r.read()
+        return time.monotonic() - t0
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        p50 = 1000 * statistics.median(pool.map(one, range(concurrency)))
+    if p50 > 1.5 * latency_ms + 50:
+        print(f"warning: mock p50 {p50:.0f} ms at {concurrency} concurrent "
+              f"requests vs --latency-ms {latency_ms:.0f} – the mock server is "
+              f"saturated, results measure it rather than the pipeline",
+              file=sys.stderr)
+    return p50
+
+
+def run_one(args, mode: str, size: int, workdir: Path, base: str) -> dict:
+    corpus = make_corpus(mode, size, workdir / f"{mode}-{size}.jsonl")
+    out_dir = workdir / f"out-{mode}-{size}"
+    cfg_kwargs = dict(model_name="mock", api_key="bench", base_url=base,
+                      mode=mode, input_file=str(corpus), output_dir=str(out_dir),
+                      max_workers=args.max_workers,
+                      max_in_flight=args.max_in_flight, http2=False,
+                      cache="off" if not args.cache else "sqlite")
+    _http(base + "/stats/reset", "POST")
+    ctx = mp.get_context("spawn")
+    q = ctx.Queue()
+    proc = ctx.Process(target=_child, args=(cfg_kwargs, q))
+    proc.start()
+    res = q.get()
+    proc.join()
+    server = _http(base + "/stats")
+    summary = res["summary"]
+    return {
+        "mode": mode, "rows": size,
+        "rows_per_s": round(size / res["elapsed_s"], 2),
+        "requests_per_s": round(server["requests"] / res["elapsed_s"], 2),
+        "requests": server["requests"], "errors": server["errors"],
+        "p50_ms": server["p50_ms"], "p99_ms": server["p99_ms"],
+        "peak_rss_mb": res["peak_rss_mb"],
+        "writer_busy_pct": round(100 * summary["writer"]["busy_fraction"], 2),
+        "writer_max_queue": summary["writer"]["max_queue_depth"],
+        "failed_rows": summary["manifest"]["F"],
+    }
+
+
+# ---------- CLI -------------------------------------------------------------- #
+def main(argv: list[str] | None = None) -> list[dict]:
+    p = argparse.ArgumentParser(description="Benchmark executor.run against a mock LLM")
+    p.add_argument("--modes", nargs="+", default=list(MODES), choices=MODES)
+    p.add_argument("--sizes", nargs="+", type=int, default=[100, 1000, 10000])
+    p.add_argument("--max-workers", type=int, default=64)
+    p.add_argument("--max-in-flight", type=int, default=256)
+    p.add_argument("--cache", action="store_true", help="keep the response cache on")
+    p.add_argument("--port", type=int, default=18000)
+    p.add_argument("--latency-ms", type=float, default=200.0)
+    p.add_argument("--jitter", type=float, default=0.5)
+    p.add_argument("--error-rate", type=float, default=0.0)
+    p.add_argument("--error-status", type=int, default=503)
+    p.add_argument("--tokens", type=int, default=32)
+    p.add_argument("--array-len", type=int, default=3,
+                   help="mock: elements per JSON array, e.g. QA pairs per chunk")
+    p.add_argument("--json", type=Path, help="also write the results here")
+    args = p.parse_args(argv)
+
+    base = f"http://127.0.0.1:{args.port}/v1"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "bench.mock_server", "--port", str(args.port),
+         "--latency-ms", str(args.latency_ms), "--jitter", str(args.jitter),
+         "--error-rate", str(args.error_rate),
+         "--error-status", str(args.error_status), "--tokens", str(args.tokens),
+         "--array-len", str(args.array_len)],
+        cwd=ROOT, stdout=subprocess.DEVNULL)
+    results = []
+    try:
+        _wait_ready(base)
+        p50 = probe(base, max(args.max_workers, args.max_in_flight), args.latency_ms)
+        print(f"mock p50 at {max(args.max_workers, args.max_in_flight)} "
+              f"concurrent requests: {p50:.0f} ms", file=sys.stderr)
+        cols = ("mode", "rows", "rows_per_s", "requests_per_s", "p50_ms",
+                "p99_ms", "peak_rss_mb", "writer_busy_pct", "writer_max_queue",
+                "failed_rows")
+        print(" | ".join(f"{c:>15}" for c in cols))
+        with tempfile.TemporaryDirectory(prefix="dat-bench-") as tmp:
+            for mode in args.modes:
+                for size in args.sizes:
+                    r = run_one(args, mode, size, Path(tmp), base)
+                    results.append(r)
+                    print(" | ".join(f"{r[c]!s:>15}" for c in cols), flush=True)
+    finally:
+        server.terminate()
+        server.wait()
+
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+    return results
+
+
+if __name__ == "__main__":
+    main()
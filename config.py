@@ -1,12 +1,41 @@
 from pathlib import Path
 from pydantic import BaseModel, Field, validator
 
+class StageConfig(BaseModel):
+    """Per-stage knobs; keys of `Config.stages` are agent names."""
+    concurrency: int | None = Field(None, description="coroutines working this stage")
+    batch_size: int | None = Field(None, description="payloads handed over per step")
+    queue_size: int | None = Field(None, description="bound of the queue in front of it")
+    model: str | None = Field(None, description="override Config.model_name")
+    base_urls: list[str] | None = Field(None, description="override the endpoint list")
+
+
+class PrefilterConfig(BaseModel):
+    """Thresholds of the local heuristic filter (utils.prefilter)."""
+    enabled: bool = Field(False, description="reject junk chunks before context validation")
+    min_chars: int = 200
+    max_chars: int | None = None
+    min_words: int = 20
+    min_alpha_ratio: float = Field(0.6, description="letters / non-space characters")
+    max_digit_ratio: float = Field(0.3, description="digits / non-space characters")
+    max_symbol_ratio: float = Field(0.25, description="punctuation / non-space characters")
+    max_dup_line_ratio: float = Field(0.3, description="repeated lines / lines")
+    min_unique_word_ratio: float = Field(0.2, description="distinct words / words")
+    max_short_line_ratio: float = Field(0.7, description="lines under 4 words / lines (menus, footers)")
+    languages: list[str] | None = Field(None, description="ISO codes to keep; needs `langid`")
+
+
 class Config(BaseModel):
     """Runtime options – filled by CLI flags or Streamlit form."""
     # LLM / API
     model_name: str = Field(..., description="HF model or local alias")
     api_key: str
     base_url: str = "http://localhost:8001/v1"
+    base_urls: list[str] = Field(default_factory=list, description="extra replicas of the same model")
+    lb_policy: str = Field("least-outstanding", description="least-outstanding | round-robin")
+    http2: bool = Field(True, description="used when the `h2` package is installed")
+    request_timeout: float = 120.0
+    max_connections: int = 512
 
     # generation mode
     mode: str = Field(..., description="single-sft | multi-sft | single-align | multi-align")
@@ -14,7 +43,158 @@ class Config(BaseModel):
     # files / paths
     input_file: Path
     output_dir: Path = Path("output")
-    max_workers: int = 8
+    max_workers: int = Field(8, description="rows processed concurrently")
+    ordered_output: bool = Field(False, description="write JSONL in input order")
+    resume: bool = Field(False, description="skip rows already done in <output>.manifest")
+    table_format: str = Field("csv", description="tabular copy of the JSONL: csv | parquet | arrow")
+
+    # sharded runs (several workers on one input, see utils.shard)
+    shard: str | None = Field(None, description="'i/N': process hash-partition i of N")
+    coordinator: Path | None = Field(None, description="SQLite lease queue shared by all workers (instead of `shard`)")
+    worker_id: str | None = Field(None, description="lease owner / output tag; default: host name")
+    lease_rows: int = Field(256, description="consecutive rows per leased batch")
+    lease_ttl: float = Field(900.0, description="seconds until an unrenewed lease may be taken over")
+
+    # offline batch mode (OpenAI-Batch files instead of live calls, see utils.batch)
+    batch_mode: bool = Field(False, description="write each stage's requests to a Batch file, run it, ingest the results")
+    batch_runner: str | None = Field(
+        None, description="command per request file with {input} {output} {model}, e.g. "
+                          "'python -m vllm.entrypoints.openai.run_batch -i {input} -o {output} --model {model}'; "
+                          "None: bundled runner over base_url")
+    batch_max_rounds: int = Field(8, description="batch rounds before rows still waiting are left failed")
+
+    # async engine limits
+    max_in_flight: int = Field(64, description="ceiling for the adaptive in-flight request limit")
+    latency_target: float | None = Field(None, description="seconds; slower replies shrink the limit")
+    max_retries: int = 6
+    request_deadline: float = Field(600.0, description="seconds per request, retries included")
+    stage_limits: dict[str, int] = Field(
+        default_factory=dict,
+        description="per-agent request caps, e.g. {'generator': 32, 'qa_validator': 128}")
+    locality_scheduling: bool = Field(
+        True, description="run one chunk's requests back-to-back on one replica (prefix-cache hits)")
+    stages: dict[str, StageConfig] = Field(
+        default_factory=dict,
+        description="staged pipeline settings, e.g. {'context_validator': "
+                    "{'concurrency': 128, 'model': 'small-model'}}")
+
+    # local chunking (SFT inputs, before dedup)
+    chunk_tokens: int | None = Field(None, description="split texts into chunks of at most this many tokens (None = off)")
+    chunk_overlap: int = Field(0, description="tokens of whole sentences shared by consecutive chunks")
+    chunk_tokenizer: str | None = Field(None, description="HF tokenizer name / path or 'tiktoken:<encoding>'; default: heuristic count")
+    chunk_processes: int = Field(0, description="splitting processes (0 = CPU count, 1 = in-process)")
+
+    # de-duplication (SFT inputs before any LLM call, QA pairs after)
+    dedup: str = Field("exact", description="off | exact | near (MinHash/LSH)")
+    dedup_threshold: float = Field(0.85, description="Jaccard similarity counted as near-duplicate")
+    dedup_num_perm: int = Field(128, description="MinHash permutations")
+    dedup_questions: bool = Field(False, description="drop QA pairs whose normalized question repeats")
+
+    # local pre-filter (SFT inputs, before the context validator)
+    prefilter: PrefilterConfig = Field(default_factory=PrefilterConfig)
+
+    # observability
+    metrics_port: int | None = Field(None, description="serve Prometheus /metrics here (needs prometheus_client)")
+    otel_tracing: bool = Field(False, description="OpenTelemetry span per agent call (needs opentelemetry-api)")
+    price_prompt_per_mtok: float = Field(0.0, description="cost per 1M prompt tokens, for the summary estimate")
+    price_completion_per_mtok: float = Field(0.0, description="cost per 1M completion tokens")
+
+    # agents
+    batch_qa_validation: bool = Field(True, description="validate all QA pairs of a chunk in one call")
+    samples_per_context: int = Field(1, description="generate_qa / multi-sft completions per context from one request (`n`, shared prefill), deduplicated by content")
+    orpo_variants: int = Field(3, description="ORPO variants per seed (one per turn from the end), generated concurrently")
+    orpo_generators: list[str] = Field(
+        default_factory=lambda: ["rlhf_irrelevant_content_generator",
+                                 "rlhf_incorrect_facts_generator",
+                                 "rlhf_offensive_tone_generator"],
+        description="config.yaml agents writing the rejected answers, used in rotation")
+
+    # response cache (deterministic calls only)
+    cache: str = Field("sqlite", description="sqlite | memory | off")
+    cache_path: Path | None = Field(None, description="default: <output_dir>/.llm_cache.sqlite")
+    cache_max_mb: int = 1024
+
+    @validator("lb_policy")
+    def _check_lb_policy(cls, v: str) -> str:
+        if v not in {"least-outstanding", "round-robin"}:
+            raise ValueError("`lb_policy` must be least-outstanding | round-robin")
+        return v
+
+    @validator("cache")
+    def _check_cache(cls, v: str) -> str:
+        if v not in {"sqlite", "memory", "off"}:
+            raise ValueError("`cache` must be one of sqlite | memory | off")
+        return v
+
+    @validator("dedup")
+    def _check_dedup(cls, v: str) -> str:
+        if v not in {"off", "exact", "near"}:
+            raise ValueError("`dedup` must be one of off | exact | near")
+        return v
+
+    @validator("dedup_threshold")
+    def _check_dedup_threshold(cls, v: float) -> float:
+        if not 0.0 < v <= 1.0:
+            raise ValueError("`dedup_threshold` must be in (0, 1]")
+        return v
+
+    @validator("chunk_overlap")
+    def _check_chunk_overlap(cls, v: int, values: dict) -> int:
+        budget = values.get("chunk_tokens")
+        if v < 0 or (budget is not None and v >= budget):
+            raise ValueError("`chunk_overlap` must be in [0, chunk_tokens)")
+        return v
+
+    @validator("batch_mode")
+    def _check_batch_mode(cls, v: bool, values: dict) -> bool:
+        if v and values.get("coordinator") is not None:
+            raise ValueError("`batch_mode` works with `shard`, not a `coordinator`")
+        return v
+
+    @validator("batch_max_rounds")
+    def _check_batch_max_rounds(cls, v: int) -> int:
+        if v < 1:
+            raise ValueError("`batch_max_rounds` must be >= 1")
+        return v
+
+    @validator("samples_per_context")
+    def _check_samples_per_context(cls, v: int) -> int:
+        if v < 1:
+            raise ValueError("`samples_per_context` must be >= 1")
+        return v
+
+    @validator("orpo_variants")
+    def _check_orpo_variants(cls, v: int) -> int:
+        if v < 1:
+            raise ValueError("`orpo_variants` must be >= 1")
+        return v
+
+    @validator("orpo_generators")
+    def _check_orpo_generators(cls, v: list[str]) -> list[str]:
+        if not v:
+            raise ValueError("`orpo_generators` must name at least one agent")
+        return v
+
+    @validator("shard")
+    def _check_shard(cls, v: str | None) -> str | None:
+        if v is None:
+            return v
+        i, _, n = v.partition("/")
+        if not (i.isdigit() and n.isdigit() and 0 <= int(i) < int(n)):
+            raise ValueError("`shard` must be 'i/N' with 0 <= i < N")
+        return v
+
+    @validator("coordinator")
+    def _check_coordinator(cls, v: Path | None, values: dict) -> Path | None:
+        if v is not None and values.get("shard"):
+            raise ValueError("use either `shard` or `coordinator`, not both")
+        return v
+
+    @validator("table_format")
+    def _check_table_format(cls, v: str) -> str:
+        if v not in {"csv", "parquet", "arrow"}:
+            raise ValueError("`table_format` must be one of csv | parquet | arrow")
+        return v
 
     @validator("mode")
     def _check_mode(cls, v: str) -> str:
@@ -1,8 +1,19 @@
 """
 A single entry-point for *all* pipelines.  UI + CLI both call `run(cfg)`.
+
+    python executor.py --mode single-sft --input-file data.jsonl \
+                       --model-name M --base-url http://gpu1:8000/v1,http://gpu2:8000/v1 \
+                       [--shard 0/4 | --coordinator /shared/leases.sqlite] [--resume]
+    python executor.py ... --merge          # combine the shard outputs
+
+See utils.shard for how rows are split between workers.
 """
+import argparse
 import importlib
+import json
 import logging
+from pathlib import Path
+
 from config import Config
 
 log = logging.getLogger(__name__)
@@ -13,9 +24,80 @@ _MAP = {
     "single-align": ("alignment_data", "run_single"),
     "multi-align" : ("alignment_data", "run_multi"),
 }
+_TABLE_KIND = {"single-sft": "qa", "multi-sft": "conversation",
+               "single-align": "orpo", "multi-align": "orpo"}
+
+
 def run(cfg: Config):
     mod_name, fn_name = _MAP[cfg.mode]
     mod = importlib.import_module(mod_name)
     run_fn = getattr(mod, fn_name)
     log.info("▶️  Running mode=%s via %s.%s", cfg.mode, mod_name, fn_name)
     return run_fn(cfg)
+
+
+def merge(cfg: Config, parts: list[Path] | None = None):
+    """Combine `<output>.shard-*.jsonl` in `cfg.output_dir` into `<output>.jsonl`."""
+    from utils.io    import export_table, TABLE_FORMATS
+    from utils.shard import merge_shards, output_json
+
+    out_json = output_json(cfg, shard=False)
+    if parts is None:
+        parts = sorted(out_json.parent.glob(f"{out_json.stem}.shard-*.jsonl"))
+    if not parts:
+        raise FileNotFoundError(f"no shard outputs for {out_json.name} "
+                                f"in {out_json.parent}")
+    merge_shards(out_json, parts)
+    out_table = out_json.with_suffix(TABLE_FORMATS[cfg.table_format])
+    n = export_table(out_json, out_table, cfg.table_format, _TABLE_KIND[cfg.mode])
+    log.info("✅  merged %s shards: %s rows → %s / %s", len(parts), n,
+             out_table, out_json)
+    return out_table, out_json
+
+
+# ---------- CLI -------------------------------------------------------------- #
+def _value(text: str):
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def main(argv: list[str] | None = None) -> None:
+    p = argparse.ArgumentParser(description="Run a pipeline without the UI.")
+    p.add_argument("--mode", required=True, choices=list(_MAP))
+    p.add_argument("--input-file", required=True, type=Path)
+    p.add_argument("--output-dir", type=Path, default=Path("output"))
+    p.add_argument("--model-name", required=True)
+    p.add_argument("--api-key", default=None,
+                   help="default: LLM_API_KEY from the environment / .env")
+    p.add_argument("--base-url", default="http://localhost:8001/v1",
+                   help="comma-separated replicas of the same model")
+    p.add_argument("--resume", action="store_true")
+    p.add_argument("--shard", metavar="i/N",
+                   help="process hash-partition i of N of the input")
+    p.add_argument("--coordinator", type=Path, metavar="DB",
+                   help="lease batches from this SQLite file shared by all workers")
+    p.add_argument("--worker-id", help="lease owner / output tag (default: host name)")
+    p.add_argument("--merge", action="store_true",
+                   help="combine the shard outputs in --output-dir and exit")
+    p.add_argument("--set", action="append", default=[], metavar="KEY=VALUE",
+                   help="any other Config field; VALUE is parsed as JSON if it can be")
+    a = p.parse_args(argv)
+
+    urls = [u.strip() for u in a.base_url.split(",") if u.strip()]
+    extra = dict(kv.split("=", 1) for kv in a.set)
+    fields = dict(model_name=a.model_name, api_key=a.api_key or "",
+                  base_url=urls[0], base_urls=urls[1:], mode=a.mode,
+                  input_file=a.input_file, output_dir=a.output_dir,
+                  resume=a.resume, shard=a.shard, coordinator=a.coordinator,
+                  worker_id=a.worker_id)
+    fields.update({k: _value(v) for k, v in extra.items()})   # --set wins
+    cfg = Config(**fields)
+    print(merge(cfg) if a.merge else run(cfg))
+
+
+if __name__ == "__main__":
+    from utils.logger import init_root
+    init_root()
+    main()
@@ -11,97 +11,148 @@ Public wrappers:
     run_multi(cfg)    → for executor when cfg.mode == "multi-sft"
 """
 from __future__ import annotations
-import json, logging
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from pathlib import Path
-
-import pandas as pd
+import asyncio, logging
+from functools import partial
+from typing import TYPE_CHECKING
 
 # ---- business-logic imports (your code) --------------------------------------
 from agents.generator           import generate_qa
-from agents.multiturngenerator  import generate_multi_turn_conversation
+from agents.multiturngenerator  import (generate_multi_turn_conversation,
+                                        generate_multi_turn_conversations)
 from agents.contextvalidator    import validate_context
-from agents.qavalidator         import validate_qa
+from agents.qavalidator         import validate_qa, validate_qa_batch
 # ------------------------------------------------------------------------------
-from utils.io      import tqdm_std, safe_jsonl_writer
+from utils.io      import iter_records, count_records, export_table, TABLE_FORMATS
+from utils.shard   import output_json
+from utils.engine  import run_to_jsonl, Stage
+from utils.chunking import chunk_items
+from utils.dedup   import open_deduper, dedup_items, QuestionDeduper
 from utils.logger  import init_root
 from config        import Config
 
+if TYPE_CHECKING:
+    from utils.prefilter import Prefilter
+
 init_root()
 log = logging.getLogger(__name__)
 
 
+def _texts(cfg: Config):
+    """
+    Stream (idx, text) pairs straight from disk (only `text` is decoded),
+    split to `cfg.chunk_tokens` if set (idx then numbers the chunks), minus
+    duplicate chunks per `cfg.dedup` – those never reach an agent.
+    """
+    rows = ((i, row["text"])
+            for i, row in enumerate(iter_records(cfg.input_file, ["text"])))
+    if cfg.chunk_tokens:
+        rows = chunk_items(rows, cfg)
+    return dedup_items(rows, open_deduper(cfg))
+
+
+def _total(cfg: Config) -> int | None:
+    """Progress total: input rows, unless chunking makes them unknowable."""
+    return None if cfg.chunk_tokens else count_records(cfg.input_file)
+
+
 # ──────────────────────────────────────────────────────────────────────────────
 # SINGLE-TURN helpers
 # ──────────────────────────────────────────────────────────────────────────────
-def _single_worker(idx: int, chunk: str, jf, rows: list[dict]):
-    try:
-        if not validate_context(chunk):
-            return
-        for qa in generate_qa(chunk):
-            q, a = qa["question"], qa["answer"]
-            if validate_qa(q, a, chunk):
-                rows.append({"question": q, "answer": a, "context": chunk})
-                json.dump({"question": q, "answer": a, "context": chunk},
-                          jf, ensure_ascii=False)
-                jf.write("\n")
-    except Exception as e:
-        log.exception("single-turn chunk %s failed: %s", idx, e)
+# validate → generate → verify, each stage with its own worker pool (see
+# utils.engine); stage names match the agents so `cfg.stages[...]` can tune
+# concurrency / batching / model per agent.
+async def _validate_stage(idx: int, chunk: str) -> str | None:
+    return chunk if await validate_context(chunk) else None   # None: rejected
+
+
+async def _generate_stage(idx: int, chunk: str,
+                          n: int = 1) -> tuple[str, list[dict]]:
+    return chunk, await generate_qa(chunk, n)
+
+
+async def _verify_stage(idx: int, job: tuple[str, list[dict]],
+                        batch_validate: bool = True,
+                        questions: QuestionDeduper | None = None) -> list[dict]:
+    chunk, pairs = job
+    if batch_validate:
+        verdicts = await validate_qa_batch(
+            [(qa["question"], qa["answer"]) for qa in pairs], chunk)
+    else:
+        verdicts = await asyncio.gather(
+            *(validate_qa(qa["question"], qa["answer"], chunk) for qa in pairs))
+    kept = [qa for qa, ok in zip(pairs, verdicts) if ok]
+    if questions is not None:
+        kept = questions.filter(kept)
+    return [{"question": qa["question"], "answer": qa["answer"],
+             "context": chunk} for qa in kept]
+
+
+def _prefilter(cfg: Config) -> tuple[Prefilter | None, list[Stage]]:
+    """Optional local filter stage in front of the first LLM stage."""
+    if not cfg.prefilter.enabled:
+        return None, []
+    from utils.prefilter import Prefilter, prefilter_stage   # numpy: on demand
+    pf = Prefilter(cfg.prefilter)
+    return pf, [prefilter_stage(cfg, pf)]
+
+
+def _single_stages(cfg: Config,
+                   questions: QuestionDeduper | None = None) -> list[Stage]:
+    verify = partial(_verify_stage, batch_validate=cfg.batch_qa_validation,
+                     questions=questions)
+    return [Stage.from_config(cfg, "context_validator", _validate_stage),
+            Stage.from_config(cfg, "generator",
+                              partial(_generate_stage, n=cfg.samples_per_context)),
+            Stage.from_config(cfg, "qa_validator",      verify)]
 
 
 def _run_single(cfg: Config):
-    data = pd.read_json(cfg.input_file, lines=True)
-    out_csv  = cfg.output_dir / f"{cfg.model_name.replace('/','-')}_single_sft.csv"
-    out_json = cfg.output_dir / f"{cfg.model_name.replace('/','-')}_single_sft.jsonl"
-    rows: list[dict] = []
-
-    with safe_jsonl_writer(out_json) as jf, \
-         ThreadPoolExecutor(max_workers=cfg.max_workers) as pool:
+    out_json  = output_json(cfg)
+    out_table = out_json.with_suffix(TABLE_FORMATS[cfg.table_format])
 
-        futures = {pool.submit(_single_worker, i, txt, jf, rows): i
-                   for i, txt in enumerate(data["text"])}
-        for _ in tqdm_std(as_completed(futures), total=len(futures),
-                          desc="Single-turn SFT"):
-            pass
+    questions = QuestionDeduper() if cfg.dedup_questions else None
+    pf, pre = _prefilter(cfg)
+    run_to_jsonl(cfg, out_json, partial(_texts, cfg),
+                 stages=pre + _single_stages(cfg, questions),
+                 desc="Single-turn SFT", total=_total(cfg))
+    if pf is not None:
+        pf.log_counts()
+    if questions is not None:
+        log.info("dedup: dropped %s QA pairs with a repeated question",
+                 questions.n_dropped)
 
-    pd.DataFrame(rows).to_csv(out_csv, index=False)
-    log.info("✅  single-turn: %s rows → %s / %s", len(rows), out_csv, out_json)
-    return out_csv, out_json
+    n = export_table(out_json, out_table, cfg.table_format, "qa")
+    log.info("✅  single-turn: %s rows → %s / %s", n, out_table, out_json)
+    return out_table, out_json
 
 
 # ──────────────────────────────────────────────────────────────────────────────
 # MULTI-TURN helpers
 # ──────────────────────────────────────────────────────────────────────────────
-def _multi_worker(idx: int, chunk: str, jf, rows: list[dict]):
-    try:
-        conv = generate_multi_turn_conversation(chunk)
-        if conv:
-            rows.append({"context": chunk, "conversation": conv})
-            json.dump({"context": chunk, "conversation": conv}, jf,
-                      ensure_ascii=False)
-            jf.write("\n")
-    except Exception as e:
-        log.exception("multi-turn chunk %s failed: %s", idx, e)
+async def _multi_worker(idx: int, chunk: str, n: int = 1) -> list[dict]:
+    if n > 1:       # one request, n samples; repeated conversations dropped
+        convs = await generate_multi_turn_conversations(chunk, n)
+    else:
+        convs = [await generate_multi_turn_conversation(chunk)]
+    return [{"context": chunk, "conversation": conv} for conv in convs if conv]
 
 
 def _run_multi(cfg: Config):
-    data = pd.read_json(cfg.input_file, lines=True)
-    out_csv  = cfg.output_dir / f"{cfg.model_name.replace('/','-')}_multi_sft.csv"
-    out_json = cfg.output_dir / f"{cfg.model_name.replace('/','-')}_multi_sft.jsonl"
-    rows: list[dict] = []
-
-    with safe_jsonl_writer(out_json) as jf, \
-         ThreadPoolExecutor(max_workers=cfg.max_workers) as pool:
-
-        futures = {pool.submit(_multi_worker, i, txt, jf, rows): i
-                   for i, txt in enumerate(data["text"])}
-        for _ in tqdm_std(as_completed(futures), total=len(futures),
-                          desc="Multi-turn SFT"):
-            pass
-
-    pd.DataFrame(rows).to_csv(out_csv, index=False)
-    log.info("✅  multi-turn: %s convs → %s / %s", len(rows), out_csv, out_json)
-    return out_csv, out_json
+    out_json  = output_json(cfg)
+    out_table = out_json.with_suffix(TABLE_FORMATS[cfg.table_format])
+
+    pf, pre = _prefilter(cfg)
+    run_to_jsonl(cfg, out_json, partial(_texts, cfg),
+                 stages=pre + [Stage.from_config(
+                     cfg, "multi_turn_generator",
+                     partial(_multi_worker, n=cfg.samples_per_context))],
+                 desc="Multi-turn SFT", total=_total(cfg))
+    if pf is not None:
+        pf.log_counts()
+
+    n = export_table(out_json, out_table, cfg.table_format, "conversation")
+    log.info("✅  multi-turn: %s convs → %s / %s", n, out_table, out_json)
+    return out_table, out_json
 
 
 # ──────────────────────────────────────────────────────────────────────────────
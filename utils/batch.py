@@ -0,0 +1,197 @@
+"""
+Offline batch mode (`Config.batch_mode`) – agent requests go through
+OpenAI-Batch files instead of live HTTP calls.
+
+The run goes in rounds (driven by `utils.engine.run_to_jsonl`):
+
+1. every unfinished row is replayed through the pipeline; an agent call
+   whose result is already ingested returns at once, the first one that is
+   not is appended to `<out>.batch/round-<k>.<stage>.requests.jsonl` and
+   the row is parked (`Deferred`, status F in the manifest, no error log)
+2. each request file is run by `Config.batch_runner` – any command with
+   `{input}` / `{output}` / `{model}` placeholders, e.g. vLLM's
+   `python -m vllm.entrypoints.openai.run_batch -i {input} -o {output} --model {model}`
+   – or, when unset, by `run_bundled()`, a stand-in that sends the file
+   through the usual client stack, routed like live calls of that stage
+3. the output lines are ingested by `custom_id` (a hash of the request
+   body) into `<out>.batch/results.sqlite`, and the next round starts with
+   `resume=True`
+
+So single-turn SFT takes context validation → generation → QA validation
+as three rounds, each one file per stage that the inference server can
+schedule as a whole.  Ingested results survive a crash: a rerun replays
+them without asking again.  Requests that errored are simply asked again in
+the next round; after `Config.batch_max_rounds` rounds the rows still
+waiting stay failed (rerun with `resume=True`).
+
+* open_batch(cfg, out_json) – a BatchRecorder when `cfg.batch_mode`, else None
+* BatchRecorder.call(stage, body)
+                            – used by `utils.llm.parse/parse_n/complete`
+* BatchRecorder.run_round(cfg, metrics)
+                            – run + ingest the files of this round
+"""
+from __future__ import annotations
+import asyncio, hashlib, json, logging, shlex, subprocess, time
+from pathlib import Path
+from typing import IO
+
+from utils.cache   import SQLiteCache
+from utils.metrics import Metrics
+from config import Config
+
+log = logging.getLogger(__name__)
+
+URL = "/v1/chat/completions"
+
+
+class Deferred(Exception):
+    """The call's result is not ingested yet – the row waits for the next round."""
+
+
+def custom_id(body: dict) -> str:
+    payload = json.dumps(body, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _content(choices: list[dict]) -> str | None:
+    """The message content; a JSON list of them for an `n` > 1 request."""
+    contents = [c["message"].get("content") for c in choices]
+    if None in contents:
+        return None
+    return contents[0] if len(contents) == 1 else json.dumps(contents)
+
+
+class BatchRecorder:
+    def __init__(self, root: Path, max_rounds: int = 8):
+        self.root = root
+        self.max_rounds = max_rounds
+        self.round = 0
+        self.store = SQLiteCache(root / "results.sqlite", max_bytes=1 << 62)
+        self._files: dict[str, tuple[Path, IO[str], str]] = {}
+        self._seen: set[str] = set()
+
+    # -- collect (event-loop thread) -----------------------------------------
+    def call(self, stage: str, body: dict) -> str:
+        """The ingested content for `body`, else record it and raise Deferred."""
+        cid = custom_id(body)
+        hit = self.store.get(cid)
+        if hit is not None:
+            return hit
+        if cid not in self._seen:
+            self._seen.add(cid)
+            if stage not in self._files:
+                path = self.root / f"round-{self.round + 1}.{stage}.requests.jsonl"
+                self._files[stage] = (path, path.open("w", encoding="utf-8"),
+                                      body["model"])
+            line = {"custom_id": cid, "method": "POST", "url": URL, "body": body}
+            self._files[stage][1].write(json.dumps(line, ensure_ascii=False) + "\n")
+        raise Deferred(stage)
+
+    @property
+    def pending(self) -> int:
+        return len(self._seen)
+
+    # -- run + ingest (between rounds) ---------------------------------------
+    def run_round(self, cfg: Config, metrics: Metrics | None = None) -> bool:
+        """Run this round's request files; False when there is nothing to run
+        (all rows settled) or `max_rounds` is used up."""
+        files, self._files = self._files, {}
+        n_pending, self._seen = len(self._seen), set()
+        for _, fh, _ in files.values():
+            fh.close()
+        if not files:
+            return False
+        if self.round >= self.max_rounds:
+            log.warning("batch: %s requests still unanswered after %s rounds – "
+                        "their rows stay failed", n_pending, self.round)
+            return False
+
+        self.round += 1
+        for stage, (src, _, model) in files.items():
+            dst = src.with_name(src.name.replace(".requests.", ".results."))
+            t0 = time.monotonic()
+            log.info("batch round %s: %s → %s", self.round, src.name, dst.name)
+            if cfg.batch_runner:
+                cmd = cfg.batch_runner.format(input=shlex.quote(str(src)),
+                                              output=shlex.quote(str(dst)),
+                                              model=shlex.quote(model))
+                subprocess.run(shlex.split(cmd), check=True)
+            else:
+                asyncio.run(run_bundled(cfg, src, dst, stage))
+            ok, failed = self.ingest(dst, stage, metrics)
+            log.info("batch round %s: %s ok / %s failed for %s in %.1fs",
+                     self.round, ok, failed, stage, time.monotonic() - t0)
+        return True
+
+    def ingest(self, results: Path, stage: str,
+               metrics: Metrics | None = None) -> tuple[int, int]:
+        """Store the content of every successful result line by custom_id."""
+        ok = failed = 0
+        with results.open(encoding="utf-8") as fh:
+            for line in fh:
+                if not line.strip():
+                    continue
+                rec = json.loads(line)
+                resp = rec.get("response") or {}
+                body = resp.get("body") or {}
+                err = rec.get("error")
+                if not err and resp.get("status_code") != 200:
+                    err = {"code": resp.get("status_code")}
+                content = None if err else _content(body["choices"])
+                if content is None:
+                    err = err or {"code": "empty"}
+                    failed += 1
+                    log.debug("batch: %s failed: %s", rec.get("custom_id"), err)
+                else:
+                    ok += 1
+                    self.store.set(rec["custom_id"], content)
+                if metrics is not None:
+                    metrics.ingested(stage, body.get("usage"),
+                                     err and str(err.get("code")))
+        return ok, failed
+
+    def close(self) -> None:
+        for _, fh, _ in self._files.values():
+            fh.close()
+        self.store.close()
+
+
+def open_batch(cfg: Config, out_json: Path) -> BatchRecorder | None:
+    if not cfg.batch_mode:
+        return None
+    return BatchRecorder(out_json.with_suffix(".batch"), cfg.batch_max_rounds)
+
+
+# ---------- bundled runner --------------------------------------------------- #
+async def run_bundled(cfg: Config, src: Path, dst: Path, stage: str) -> None:
+    """Stand-in for a batch runner: send every line of `src` through
+    `utils.llm` as calls of `stage` (the agent that recorded the file, so
+    its `Config.stages` base URLs / limits apply), write OpenAI-Batch output
+    lines to `dst` (unordered)."""
+    from utils import llm
+
+    async def _one(n: int, req: dict) -> dict:
+        rec = {"id": f"batch_req_{n}", "custom_id": req["custom_id"],
+               "response": None, "error": None}
+        try:
+            resp = await llm.chat(stage, req["body"])
+        except Exception as e:
+            rec["error"] = {"code": type(e).__name__, "message": str(e)}
+        else:
+            rec["response"] = {"status_code": 200,
+                               "body": resp.model_dump(mode="json")}
+        return rec
+
+    window = 2 * cfg.max_in_flight
+    async with llm.session(cfg, Metrics()):
+        with src.open(encoding="utf-8") as fi, dst.open("w", encoding="utf-8") as fo:
+            tasks: set[asyncio.Task] = set()
+            for n, line in enumerate(fi):
+                tasks.add(asyncio.create_task(_one(n, json.loads(line))))
+                if len(tasks) >= window:
+                    done, tasks = await asyncio.wait(
+                        tasks, return_when=asyncio.FIRST_COMPLETED)
+                    for t in done:
+                        fo.write(json.dumps(t.result(), ensure_ascii=False) + "\n")
+            for t in asyncio.as_completed(tasks):
+                fo.write(json.dumps(await t, ensure_ascii=False) + "\n")
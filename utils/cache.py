@@ -0,0 +1,146 @@
+"""
+Content-addressed cache for LLM responses.
+
+* make_key(...)   – sha256 over (model, system-prompt hash, remaining
+                    messages, sampling params, response schema)
+* MemoryCache     – in-process LRU (entry-count bound)
+* SQLiteCache     – on-disk store, LRU eviction once `max_bytes` is exceeded
+* TieredCache     – memory in front of disk
+* open_cache(cfg) – build whatever `Config.cache` asks for (or None)
+
+Backends only need `get(key) -> str | None`, `set(key, value)` and
+`close()`, so another store (LMDB, Redis …) can be dropped in.
+`utils.llm` consults the cache for deterministic calls only.
+"""
+from __future__ import annotations
+import hashlib, json, logging, sqlite3, time
+from collections import OrderedDict
+from pathlib import Path
+
+from config import Config
+
+log = logging.getLogger(__name__)
+
+
+def _sha(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def make_key(model: str, messages: list[dict], params: dict,
+             schema: dict | None = None) -> str:
+    system = "".join(m["content"] for m in messages if m["role"] == "system")
+    rest = [m for m in messages if m["role"] != "system"]
+    payload = json.dumps([model, _sha(system), rest, params, schema],
+                         sort_keys=True, ensure_ascii=False, default=str)
+    return _sha(payload)
+
+
+# ---------- backends --------------------------------------------------------- #
+class MemoryCache:
+    def __init__(self, max_entries: int = 50_000):
+        self.max_entries = max_entries
+        self._d: OrderedDict[str, str] = OrderedDict()
+
+    def get(self, key: str) -> str | None:
+        value = self._d.get(key)
+        if value is not None:
+            self._d.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        self._d[key] = value
+        self._d.move_to_end(key)
+        while len(self._d) > self.max_entries:
+            self._d.popitem(last=False)
+
+    def close(self) -> None:
+        self._d.clear()
+
+
+class SQLiteCache:
+    """Single-file cache; least-recently-used rows go first when full."""
+
+    def __init__(self, path: Path, max_bytes: int = 1 << 30):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self._db = sqlite3.connect(str(path), check_same_thread=False,
+                                   isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS llm_cache ("
+                         " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+                         " size INTEGER NOT NULL, atime REAL NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS llm_cache_atime"
+                         " ON llm_cache(atime)")
+        self._size = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+
+    def get(self, key: str) -> str | None:
+        row = self._db.execute("SELECT value FROM llm_cache WHERE key = ?",
+                               (key,)).fetchone()
+        if row is None:
+            return None
+        self._db.execute("UPDATE llm_cache SET atime = ? WHERE key = ?",
+                         (time.time(), key))
+        return row[0]
+
+    def set(self, key: str, value: str) -> None:
+        size = len(value.encode("utf-8"))
+        old = self._db.execute("SELECT size FROM llm_cache WHERE key = ?",
+                               (key,)).fetchone()
+        self._db.execute("INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?)",
+                         (key, value, size, time.time()))
+        self._size += size - (old[0] if old else 0)
+        if self._size > self.max_bytes:
+            self._evict(int(self.max_bytes * 0.9))
+
+    def _evict(self, target: int) -> None:
+        freed = 0
+        rows = self._db.execute("SELECT key, size FROM llm_cache ORDER BY atime")
+        doomed = []
+        for key, size in rows:
+            if self._size - freed <= target:
+                break
+            doomed.append((key,))
+            freed += size
+        rows.close()
+        self._db.executemany("DELETE FROM llm_cache WHERE key = ?", doomed)
+        self._size -= freed
+        log.info("LLM cache: evicted %s entries (%.1f MB)",
+                 len(doomed), freed / 1e6)
+
+    def close(self) -> None:
+        self._db.close()
+
+
+class TieredCache:
+    def __init__(self, front: MemoryCache, back):
+        self.front, self.back = front, back
+
+    def get(self, key: str) -> str | None:
+        value = self.front.get(key)
+        if value is None:
+            value = self.back.get(key)
+            if value is not None:
+                self.front.set(key, value)
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        self.front.set(key, value)
+        self.back.set(key, value)
+
+    def close(self) -> None:
+        self.front.close()
+        self.back.close()
+
+
+def open_cache(cfg: Config):
+    """`Config.cache`: "sqlite" (memory + disk) | "memory" | "off"."""
+    if cfg.cache == "off":
+        return None
+    if cfg.cache == "memory":
+        return MemoryCache()
+    path = cfg.cache_path or cfg.output_dir / ".llm_cache.sqlite"
+    return TieredCache(MemoryCache(),
+                       SQLiteCache(Path(path), cfg.cache_max_mb * 1_000_000))
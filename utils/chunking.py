@@ -0,0 +1,223 @@
+"""
+Local, deterministic, token-aware chunking (replaces the LLM chunker).
+
+* load_counter(name)           – `str -> int` token counter
+    - None                     – heuristic: one token per CJK character,
+                                 ⌈len/4⌉ per other word, one per symbol
+    - "tiktoken:<encoding>"    – tiktoken (optional dependency)
+    - anything else            – HF tokenizer name / path via `tokenizers`
+                                 or `transformers` (optional dependencies)
+* split_text(text, budget, overlap, count)
+                               – chunks of ≤ `budget` tokens cut at
+                                 sentence ends (。！？ . ! ?) and preferably
+                                 paragraph breaks; consecutive chunks share
+                                 up to `overlap` tokens of whole sentences.
+                                 Chunks are verbatim slices of the input.
+* chunk_items(items, cfg)      – `(idx, text)` stream → `(chunk_no, chunk)`
+                                 stream, split in a process pool; chunks are
+                                 numbered densely in input order, so the
+                                 numbering is stable across (resumed) runs;
+                                 an unguarded main script gets in-process
+                                 splitting (spawn would re-run it)
+"""
+from __future__ import annotations
+import logging, math, multiprocessing as mp, os, re, sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, Iterator
+
+from config import Config
+
+log = logging.getLogger(__name__)
+
+TokenCounter = Callable[[str], int]
+
+_CJK      = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff66-\uff9f"
+_UNIT     = re.compile(rf"[{_CJK}]|[^\W{_CJK}]+|[^\w\s]")
+_BOUNDARY = re.compile(r"(?:\n[ \t]*\n\s*"                     # paragraph
+                       r"|(?:[。！？]|[.!?](?=\s))"             # sentence end
+                       r"[」』）)\"'’”]*[ \t]*\n?)")
+_PARA     = re.compile(r"\n[ \t]*\n\s*$")
+
+
+# ---------- token counters --------------------------------------------------- #
+def approx_tokens(text: str) -> int:
+    n = 0
+    for m in _UNIT.finditer(text):
+        n += 1 if len(m.group()) == 1 else math.ceil(len(m.group()) / 4)
+    return n
+
+
+def load_counter(name: str | None) -> TokenCounter:
+    if not name:
+        return approx_tokens
+    if name.startswith("tiktoken:"):
+        import tiktoken
+        enc = tiktoken.get_encoding(name.split(":", 1)[1])
+        return lambda t: len(enc.encode_ordinary(t))
+    try:
+        from tokenizers import Tokenizer
+        tok = Tokenizer.from_pretrained(name) if not os.path.exists(name) \
+            else Tokenizer.from_file(name)
+        return lambda t: len(tok.encode(t, add_special_tokens=False).ids)
+    except ImportError:
+        from transformers import AutoTokenizer
+        hf = AutoTokenizer.from_pretrained(name)
+        return lambda t: len(hf.encode(t, add_special_tokens=False))
+
+
+# ---------- splitting -------------------------------------------------------- #
+def _segments(text: str) -> list[str]:
+    """Sentence / paragraph pieces whose concatenation is `text`."""
+    cuts = [m.end() for m in _BOUNDARY.finditer(text)]
+    bounds = [0] + [c for c in cuts if 0 < c < len(text)] + [len(text)]
+    return [text[a:b] for a, b in zip(bounds, bounds[1:]) if b > a]
+
+
+def _hard_split(seg: str, parts: int) -> list[str]:
+    """Cut an over-long sentence into `parts` pieces, at spaces if possible."""
+    out, start, step = [], 0, len(seg) / parts
+    for k in range(1, parts):
+        cut = int(k * step)
+        space = seg.rfind(" ", start + 1, cut + 1)
+        if space > start + step / 2:
+            cut = space + 1
+        out.append(seg[start:cut])
+        start = cut
+    out.append(seg[start:])
+    return [p for p in out if p]
+
+
+def split_text(text: str, budget: int, overlap: int = 0,
+               count: TokenCounter = approx_tokens) -> list[str]:
+    if count(text) <= budget:
+        return [text]
+    segs: list[str] = []
+    for seg in _segments(text):
+        n = count(seg)
+        segs += [seg] if n <= budget else _hard_split(seg, math.ceil(n / budget))
+    toks = [count(s) for s in segs]
+
+    chunks, i = [], 0
+    while i < len(segs):
+        j, used = i, 0
+        while j < len(segs) and (j == i or used + toks[j] <= budget):
+            used += toks[j]
+            j += 1
+        if j < len(segs) and not _PARA.search(segs[j - 1]):
+            acc = used                           # prefer a paragraph break
+            for p in range(j - 1, i, -1):
+                acc -= toks[p]
+                if acc < budget / 2:
+                    break
+                if _PARA.search(segs[p - 1]):
+                    j = p
+                    break
+        chunk = "".join(segs[i:j]).strip()
+        if chunk:
+            chunks.append(chunk)
+        if j >= len(segs):
+            break
+        k, back = j, 0                           # overlap: whole sentences
+        while k - 1 > i and back + toks[k - 1] <= overlap:
+            k -= 1
+            back += toks[k]
+        i = k
+    return chunks
+
+
+# ---------- process pool ----------------------------------------------------- #
+_COUNT: TokenCounter = approx_tokens
+
+
+def _init_worker(tokenizer: str | None) -> None:
+    global _COUNT
+    _COUNT = load_counter(tokenizer)
+
+
+def _split_many(texts: list[str], budget: int, overlap: int) -> list[list[str]]:
+    return [split_text(t, budget, overlap, _COUNT) for t in texts]
+
+
+def _batches(items: Iterable[tuple[int, str]], n: int) -> Iterator[list[str]]:
+    batch: list[str] = []
+    for _, text in items:
+        batch.append(text)
+        if len(batch) == n:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+_GUARD = re.compile(r"""^if\s+__name__\s*==\s*['"]__main__['"]""", re.M)
+
+
+def _spawn_safe() -> bool:
+    """Whether spawned workers can re-import `__main__` without re-running it.
+
+    Spawn children import the parent's main script (as `__mp_main__`); a
+    script that calls into the pipelines at top level, without an
+    `if __name__ == "__main__":` guard, would start the run again in every
+    child and die there.  Interactive sessions / `python -c` have no file
+    to re-import and are safe."""
+    path = getattr(sys.modules.get("__main__"), "__file__", None)
+    if path is None:
+        return True
+    try:
+        with open(path, encoding="utf-8", errors="replace") as fh:
+            return _GUARD.search(fh.read()) is not None
+    except OSError:
+        return True                              # frozen / zipped entry point
+
+
+def chunk_items(items: Iterable[tuple[int, str]], cfg: Config,
+                rows_per_task: int = 64) -> Iterator[tuple[int, str]]:
+    """Split every text to `cfg.chunk_tokens`; yields renumbered chunks.
+
+    With `cfg.chunk_processes != 1` the splitting runs in a spawn process
+    pool, whose workers re-import the main script – so a script driving the
+    pipelines needs the usual `if __name__ == "__main__":` guard.  Without
+    one the texts are split in-process (with a warning) instead."""
+    budget, overlap = cfg.chunk_tokens, cfg.chunk_overlap
+    procs = cfg.chunk_processes or os.cpu_count() or 1
+    if procs > 1 and not _spawn_safe():
+        log.warning("chunking: the main script has no `if __name__ == "
+                    "\"__main__\":` guard, so a process pool would re-run it – "
+                    "splitting in-process")
+        procs = 1
+    n_rows = n_chunks = 0
+
+    if procs <= 1:
+        _init_worker(cfg.chunk_tokenizer)
+        results = (_split_many(b, budget, overlap)
+                   for b in _batches(items, rows_per_task))
+        pool = None
+    else:
+        # spawn: the engine's writer thread makes fork unsafe
+        pool = ProcessPoolExecutor(procs, mp_context=mp.get_context("spawn"),
+                                   initializer=_init_worker,
+                                   initargs=(cfg.chunk_tokenizer,))
+
+        def _ordered():
+            window: deque = deque()
+            for b in _batches(items, rows_per_task):
+                window.append(pool.submit(_split_many, b, budget, overlap))
+                if len(window) >= 2 * procs:     # bounded read-ahead
+                    yield window.popleft().result()
+            while window:
+                yield window.popleft().result()
+        results = _ordered()
+
+    try:
+        for per_row in results:
+            for chunks in per_row:
+                n_rows += 1
+                for chunk in chunks:
+                    yield n_chunks, chunk
+                    n_chunks += 1
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+        log.info("chunking: %s rows → %s chunks of ≤ %s tokens",
+                 n_rows, n_chunks, budget)
@@ -0,0 +1,164 @@
+"""
+Streaming exact + near-duplicate detection for input chunks and QA pairs.
+
+* normalize(text)     – NFKC, lower-case, whitespace collapsed
+* ChunkDeduper        – `duplicate(text)` → "exact" | "near" | None
+    - exact: 16-byte blake2b of the normalized text in a set
+    - near:  MinHash signature (`num_perm` permutations over word 5-gram
+             shingles) banded into an LSH index; the (bands, rows) split
+             is chosen so the S-curve crosses `threshold` (Jaccard)
+* QuestionDeduper     – drop QA pairs whose normalized question was
+                        already accepted in this run
+* distinct(items, text)
+                      – `items` minus those whose normalized `text(item)`
+                        repeats; for the samples of one `n` request
+                        (`Config.samples_per_context`)
+* open_deduper(cfg)   – ChunkDeduper for `Config.dedup`, or None
+* dedup_items(items, deduper)
+                      – generator filter for the `(idx, text)` streams fed
+                        to `utils.engine`
+
+Both indexes only grow with the number of *unique* chunks (a digest per
+chunk plus one int per LSH band).  The first occurrence in input order
+wins, so the kept set is identical on every run – which is what makes
+`resume` line up with the manifest.
+"""
+from __future__ import annotations
+import hashlib, logging, re, unicodedata, zlib
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Iterator
+
+from config import Config
+
+if TYPE_CHECKING:
+    import numpy as np
+
+log = logging.getLogger(__name__)
+
+_WORD  = re.compile(r"\w+")
+_PRIME = (1 << 61) - 1
+_MASK  = 0xFFFFFFFF
+
+
+def normalize(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFKC", text).lower().split())
+
+
+def _digest(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+def _lsh_params(threshold: float, num_perm: int) -> tuple[int, int]:
+    """(bands, rows) minimising false-positive + false-negative area."""
+    def area(f, lo, hi, steps=100):
+        h = (hi - lo) / steps
+        return sum(f(lo + (i + 0.5) * h) for i in range(steps)) * h
+
+    best, best_err = (1, num_perm), float("inf")
+    for b in range(1, num_perm + 1):
+        for r in range(1, num_perm // b + 1):
+            fp = area(lambda s: 1 - (1 - s ** r) ** b, 0.0, threshold)
+            fn = area(lambda s: (1 - s ** r) ** b, threshold, 1.0)
+            if fp + fn < best_err:
+                best, best_err = (b, r), fp + fn
+    return best
+
+
+class ChunkDeduper:
+    def __init__(self, near: bool = True, threshold: float = 0.85,
+                 num_perm: int = 128, shingle: int = 5, seed: int = 1):
+        self.near = near
+        self.shingle = shingle
+        self.n_exact = self.n_near = 0
+        self._exact: set[bytes] = set()
+        if near:
+            import numpy as np                     # near mode only
+            self._np = np
+            rng = np.random.default_rng(seed)
+            self._a = rng.integers(1, _PRIME, num_perm, dtype=np.uint64)
+            self._b = rng.integers(0, _PRIME, num_perm, dtype=np.uint64)
+            self.bands, self.rows = _lsh_params(threshold, num_perm)
+            self._tables: list[set[int]] = [set() for _ in range(self.bands)]
+
+    def _signature(self, norm: str) -> np.ndarray:
+        np = self._np
+        words = _WORD.findall(norm)
+        k = self.shingle
+        grams = ({" ".join(words[i:i + k]) for i in range(len(words) - k + 1)}
+                 if len(words) > k else {" ".join(words)})
+        h = np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams),
+                        dtype=np.uint64, count=len(grams))
+        # (a·h + b) mod p, truncated to 32 bit – one row per permutation
+        perm = (np.outer(self._a, h) + self._b[:, None]) % np.uint64(_PRIME) \
+            & np.uint64(_MASK)
+        return perm.min(axis=1)
+
+    def duplicate(self, text: str) -> str | None:
+        """Reason the text duplicates an earlier one, else index it → None."""
+        norm = normalize(text)
+        digest = _digest(norm)
+        if digest in self._exact:
+            self.n_exact += 1
+            return "exact"
+        if self.near:
+            sig = self._signature(norm)
+            keys = [hash(sig[i * self.rows:(i + 1) * self.rows].tobytes())
+                    for i in range(self.bands)]
+            if any(k in t for k, t in zip(keys, self._tables)):
+                self.n_near += 1
+                return "near"
+            for k, t in zip(keys, self._tables):
+                t.add(k)
+        self._exact.add(digest)
+        return None
+
+
+class QuestionDeduper:
+    _PUNCT = re.compile(r"[^\w\s]")
+
+    def __init__(self):
+        self.n_dropped = 0
+        self._seen: set[bytes] = set()
+
+    def filter(self, pairs: list[dict]) -> list[dict]:
+        kept = []
+        for qa in pairs:
+            digest = _digest(self._PUNCT.sub("", normalize(qa["question"])))
+            if digest in self._seen:
+                self.n_dropped += 1
+                continue
+            self._seen.add(digest)
+            kept.append(qa)
+        return kept
+
+
+def distinct(items: Iterable[Any], text: Callable[[Any], str]) -> list:
+    """First occurrence of every normalized `text(item)`, in order."""
+    seen: set[bytes] = set()
+    kept = []
+    for item in items:
+        d = _digest(normalize(text(item)))
+        if d not in seen:
+            seen.add(d)
+            kept.append(item)
+    return kept
+
+
+def open_deduper(cfg: Config) -> ChunkDeduper | None:
+    if cfg.dedup == "off":
+        return None
+    return ChunkDeduper(near=cfg.dedup == "near",
+                        threshold=cfg.dedup_threshold,
+                        num_perm=cfg.dedup_num_perm)
+
+
+def dedup_items(items: Iterable[tuple[int, str]],
+                deduper: ChunkDeduper | None) -> Iterator[tuple[int, Any]]:
+    """Pass `(idx, text)` through, skipping duplicates (keeps `idx` stable)."""
+    if deduper is None:
+        yield from items
+        return
+    for idx, text in items:
+        if deduper.duplicate(text) is None:
+            yield idx, text
+    log.info("dedup: skipped %s exact + %s near-duplicate chunks",
+             deduper.n_exact, deduper.n_near)
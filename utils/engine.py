@@ -0,0 +1,275 @@
+"""
+Async execution engine shared by every pipeline.
+
+    run_stages(cfg, items, stages, emit, ...)     – staged driver
+    run_rows(cfg, items, worker, emit, ...)       – one-stage shortcut
+    run_to_jsonl(cfg, out_json, items, worker|stages)
+                                                  – driver + sink + manifest
+
+* `items`  – iterable of (idx, item) pairs (`run_to_jsonl` also takes a
+             zero-arg callable returning one – required by `batch_mode`)
+* `Stage`  – `async def fn(idx, payload)`; every stage but the last returns
+             the payload for the next stage, the last returns the row's
+             records (possibly empty).  Returning `None` anywhere means the
+             row was rejected, an exception means it failed.
+* `emit`   – `emit(seq, idx, records, status)` called on the event-loop
+             thread for each finished row; `seq` is the 0-based dispatch
+             order, which is what `JsonlSink(ordered=True)` re-orders by
+
+Stages are connected by bounded queues (backpressure all the way back to the
+input reader, so a lazy `items` generator keeps memory flat; it is advanced
+in slices of 64 on a worker thread) and each has
+its own pool of `concurrency` coroutines.  A stage with `batch_size > 1`
+hands up to that many queued payloads to `batch_fn` at once.  The number of
+HTTP requests in flight is capped separately by `utils.llm`.
+
+With `Config.batch_mode` `run_to_jsonl` runs in rounds instead: every round
+re-reads the input, replays the unfinished rows as far as the ingested
+batch results reach and hands the requests it could not answer to
+`utils.batch` as OpenAI-Batch files (rows waiting on them end the round as
+failed, quietly), until no row waits any more.
+"""
+from __future__ import annotations
+import asyncio, itertools, json, logging, time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Iterable
+
+from utils          import llm
+from utils.metrics  import Metrics
+from utils.io       import tqdm_std, safe_jsonl_writer
+from utils.manifest import Manifest, ACCEPTED, REJECTED, FAILED
+from utils.shard    import open_partition
+from utils.batch    import BatchRecorder, Deferred, open_batch
+from config         import Config
+
+log = logging.getLogger(__name__)
+
+_DONE = object()
+
+Worker = Callable[[int, Any], Awaitable[Any]]
+Emit   = Callable[[int, int, list[dict], str], None]
+
+
+@dataclass
+class Stage:
+    name: str
+    fn: Worker | None = None
+    concurrency: int = 8
+    batch_size: int = 1
+    queue_size: int | None = None                     # default 2 × concurrency
+    batch_fn: Callable[[list[tuple[int, Any]]], Awaitable[list]] | None = None
+
+    async def run_batch(self, batch: list[tuple[int, Any]]) -> list:
+        """Results (or exceptions) in batch order."""
+        if self.batch_fn is not None:
+            try:
+                return list(await self.batch_fn(batch))
+            except Exception as e:
+                return [e] * len(batch)
+        return await asyncio.gather(*(self.fn(idx, p) for idx, p in batch),
+                                    return_exceptions=True)
+
+    @classmethod
+    def from_config(cls, cfg: Config, name: str, fn: Worker | None = None,
+                    **defaults) -> "Stage":
+        """Build a stage, letting `cfg.stages[name]` override the defaults."""
+        opts = {"concurrency": cfg.max_workers, **defaults}
+        sc = cfg.stages.get(name)
+        if sc is not None:
+            opts.update(sc.dict(include={"concurrency", "batch_size",
+                                         "queue_size"}, exclude_none=True))
+        return cls(name, fn, **opts)
+
+
+async def _drive(cfg: Config, items: Iterable[tuple[int, Any]],
+                 stages: list[Stage], emit: Emit,
+                 total: int | None, desc: str, metrics: Metrics,
+                 batch: BatchRecorder | None = None) -> int:
+    queues = [asyncio.Queue(maxsize=s.queue_size or 2 * max(1, s.concurrency))
+              for s in stages]
+    bar = tqdm_std(total=total, desc=desc)
+    n_done = 0
+
+    def _finish(seq: int, idx: int, records, status: str):
+        nonlocal n_done
+        emit(seq, idx, records or [], status)
+        n_done += 1
+        bar.update(1)
+
+    async def _take(q: asyncio.Queue, n: int) -> list:
+        """Block for one job, then grab up to n-1 more that are already queued."""
+        batch = [await q.get()]
+        while len(batch) < n and batch[-1] is not _DONE and not q.empty():
+            batch.append(q.get_nowait())
+        return batch
+
+    async def _stage_worker(k: int):
+        stage, q = stages[k], queues[k]
+        last = k == len(stages) - 1
+        while True:
+            batch = await _take(q, max(1, stage.batch_size))
+            done = batch[-1] is _DONE
+            if done:
+                batch.pop()
+                await q.put(_DONE)                    # wake the next sibling
+            if not batch:
+                return
+            llm.set_affinity(batch[0][0])         # requests of this row: one
+            t0 = time.monotonic()                 # priority + replica (llm)
+            results = await stage.run_batch([(idx, p) for _, idx, p in batch])
+            metrics.stage_step(stage.name, time.monotonic() - t0, len(batch),
+                               sum(r is not None and not isinstance(r, Exception)
+                                   for r in results))
+            for (seq, idx, _), res in zip(batch, results):
+                if isinstance(res, Deferred):         # waits for a batch round
+                    _finish(seq, idx, None, FAILED)
+                elif isinstance(res, Exception):
+                    log.error("%s: row %s failed in %s: %s", desc, idx,
+                              stage.name, res, exc_info=res)
+                    _finish(seq, idx, None, FAILED)
+                elif res is None:
+                    _finish(seq, idx, None, REJECTED)
+                elif last:
+                    _finish(seq, idx, res, ACCEPTED)
+                else:
+                    await queues[k + 1].put((seq, idx, res))
+            if done:
+                return
+
+    async def _run_stage(k: int):
+        await asyncio.gather(*(_stage_worker(k)
+                               for _ in range(max(1, stages[k].concurrency))))
+        if k + 1 < len(stages):
+            await queues[k + 1].put(_DONE)
+
+    async def _produce():
+        # pull the input in slices on a worker thread, so slow generators
+        # (file reads, the chunking process pool) never stall the loop
+        it, seq = iter(items), 0
+        while True:
+            chunk = await asyncio.to_thread(list, itertools.islice(it, 64))
+            if not chunk:
+                break
+            for idx, item in chunk:
+                await queues[0].put((seq, idx, item))
+                seq += 1
+        await queues[0].put(_DONE)
+        if total is not None and total != seq:   # estimate (dedup, blank
+            bar.total = seq                       # lines …) → exact count
+            bar.refresh()
+
+    async with llm.session(cfg, metrics, batch):
+        tasks = [asyncio.create_task(_produce())]
+        tasks += [asyncio.create_task(_run_stage(k)) for k in range(len(stages))]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for t in tasks:
+                t.cancel()
+            bar.close()
+    return n_done
+
+
+def run_stages(cfg: Config, items: Iterable[tuple[int, Any]],
+               stages: list[Stage], emit: Emit, *,
+               total: int | None = None, desc: str = "",
+               metrics: Metrics | None = None,
+               batch: BatchRecorder | None = None) -> int:
+    """Blocking entry point; returns the number of rows processed."""
+    metrics = metrics if metrics is not None else Metrics(cfg)
+    return asyncio.run(_drive(cfg, items, stages, emit, total, desc, metrics,
+                              batch))
+
+
+def run_rows(cfg: Config, items: Iterable[tuple[int, Any]], worker: Worker,
+             emit: Emit, *, total: int | None = None, desc: str = "") -> int:
+    """One-stage pipeline: `cfg.max_workers` coroutines running `worker`."""
+    return run_stages(cfg, items, [Stage("row", worker, cfg.max_workers)],
+                      emit, total=total, desc=desc)
+
+
+def run_to_jsonl(cfg: Config, out_json: Path,
+                 items: Iterable[tuple[int, Any]] | Callable[[], Iterable[tuple[int, Any]]],
+                 worker: Worker | None = None, *,
+                 stages: list[Stage] | None = None, desc: str = "",
+                 total: int | None = None,
+                 on_records: Callable[[list[dict]], None] | None = None) -> int:
+    """
+    Run `worker` (or `stages`) over `items` into `out_json` via a JsonlSink +
+    Manifest, then write a `<out>.summary.json` with row / writer stats and
+    the per-agent / per-stage metrics of this run (utils.metrics).
+
+    With `cfg.resume` rows already accepted / rejected in the manifest are
+    skipped before dispatch, and with `cfg.shard` / `cfg.coordinator` only
+    this worker's rows are dispatched (utils.shard).  With `cfg.batch_mode`
+    the rows go through batch rounds (utils.batch) and `items` must be a
+    callable, as every round reads the input again.  `total` (input rows,
+    e.g. `utils.io.count_records`) gives the progress bar a rate / ETA; rows
+    done in the manifest are taken off it, and it is dropped for sharded
+    runs.  Returns the number of records written.
+    """
+    t0 = time.monotonic()
+    metrics = Metrics(cfg)
+    if stages is None:
+        stages = [Stage("row", worker, cfg.max_workers)]
+    batch = open_batch(cfg, out_json)
+    if batch is not None and not callable(items):
+        raise TypeError("batch_mode re-reads the input: pass `items` as a callable")
+
+    n_rows = n_records = 0
+    writer = {"records": 0, "bytes": 0, "max_queue_depth": 0}
+    busy = wall = 0.0                              # writer, over all rounds
+    resume = cfg.resume
+    while True:
+        manifest = Manifest(out_json, resume=resume)
+        part = open_partition(cfg)
+        rows = items() if callable(items) else items
+        todo = ((idx, item) for idx, item in rows if not manifest.is_done(idx)
+                and (part is None or part.owns(idx)))
+        c = manifest.counts()
+        todo_total = (None if total is None or part is not None
+                      else max(0, total - c[ACCEPTED] - c[REJECTED]))
+
+        t_round = time.monotonic()
+        with safe_jsonl_writer(out_json, ordered=cfg.ordered_output,
+                               manifest=manifest) as sink:
+            def _emit(seq: int, idx: int, records: list[dict], status: str):
+                if on_records is not None:
+                    on_records(records)
+                sink.put(seq, records, idx, status)
+
+            n = run_stages(cfg, todo, stages, _emit, total=todo_total,
+                           desc=desc, metrics=metrics, batch=batch)
+        wall += time.monotonic() - t_round
+        busy += sink.busy_seconds
+        st = sink.stats()
+        writer["records"] += st["records"]
+        writer["bytes"] += st["bytes"]
+        writer["max_queue_depth"] = max(writer["max_queue_depth"],
+                                        st["max_queue_depth"])
+        manifest.close()
+        if part is not None:
+            part.finish(manifest)
+        n_rows = n_rows or n                       # later rounds: a subset
+        n_records += sink.n_records
+        if batch is None or not batch.run_round(cfg, metrics):
+            break
+        resume = True
+    if batch is not None:
+        batch.close()
+
+    c = manifest.counts()
+    elapsed = time.monotonic() - t0
+    summary = {"mode": cfg.mode, "rows_this_run": n_rows,
+               "elapsed_s": round(elapsed, 3),
+               "rows_per_s": round(n_rows / max(elapsed, 1e-9), 2),
+               "manifest": c, "writer": {**writer, "busy_fraction": round(busy / max(wall, 1e-9), 4)},
+               **metrics.summary()}
+    if batch is not None:
+        summary["batch_rounds"] = batch.round
+    out_json.with_suffix(".summary.json").write_text(json.dumps(summary, indent=2))
+    if c[FAILED]:
+        log.warning("%s: %s rows failed – rerun with resume=True to retry them",
+                    desc, c[FAILED])
+    return n_records
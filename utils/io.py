@@ -1,43 +1,486 @@
 """
 Utility wrappers for file I/O and progress display.
+
+* JsonlSink / safe_jsonl_writer – single-writer JSONL output (+ manifest)
+* iter_records(path, columns)   – streaming reader for JSONL, CSV, Parquet
+                                  and Arrow IPC (row-group batches, only the
+                                  requested columns are decoded)
+* count_records(path)           – row count when it is cheap (Parquet /
+                                  Arrow metadata, newline count of a JSONL
+                                  up to `max_bytes`), else None – the
+                                  progress total behind rate / ETA
+* export_table(jsonl, out, fmt, kind)
+                                – streaming JSONL → CSV / Parquet / Arrow
+                                  copy, nested schema via `output_schema`
 """
 from __future__ import annotations
 from contextlib import contextmanager
 from pathlib import Path
-import json
+from typing import Iterable, Iterator
+import csv, io, json, logging, os, queue, sys, threading, time
 
 from tqdm import tqdm
-from utils.logger import CURRENT_LOG_BUF           # ← IMPORT GLOBALLY
+from utils.logger import current_live
+
+try:                                               # optional fast encoder
+    import orjson
+except ImportError:                                # pragma: no cover
+    orjson = None
+
+pa = pa_ipc = pq = None                            # optional columnar I/O,
+                                                   # imported on first use
+
+log = logging.getLogger(__name__)
 
 
 # ---------- tqdm wrapper ----------------------------------------------------- #
+class _LiveTqdm(tqdm):
+    """Publishes its state to a `utils.logger.LiveLog` instead of drawing."""
+
+    def __init__(self, *args, live, **kwargs):
+        self._live = live
+        super().__init__(*args, **kwargs)
+
+    def display(self, msg=None, pos=None):
+        d = self.format_dict
+        n, total, elapsed = d["n"], d["total"], d["elapsed"]
+        rate = d["rate"] or (n / elapsed if elapsed else 0.0)
+        eta = (total - n) / rate if total and rate else None
+        self._live.publish(self.desc or "progress", n=n, total=total,
+                           rate=rate, elapsed=elapsed, eta=eta)
+        return True
+
+
 def tqdm_std(*args, **kwargs):
     """
-    Unified entry point so every pipeline shows its progress bar **inside**
-    the Streamlit live-log pane.
+    Unified entry point for every pipeline's progress bar.
 
-    * If the caller did not pass `file=...` **and** the global buffer exists,
-      we set `file=CURRENT_LOG_BUF`.
+    * While a `LiveLog` is attached (Streamlit) the bar publishes structured
+      progress (n, total, rate, elapsed, eta) to it instead of text lines.
+    * Otherwise a plain tqdm bar on stderr.
 
-    * We also tweak bar_format / ascii so the bar prints a new line each
-      update instead of re-writing one line (Streamlit can't interpret \r).
+    Either way it redraws at most every `mininterval` (0.5 s) – throttled by
+    time, not per row.
     """
-    if "file" not in kwargs and CURRENT_LOG_BUF is not None:
-        kwargs["file"] = CURRENT_LOG_BUF
-
-    kwargs.setdefault(
-        "bar_format",
-        "{desc:<15} {percentage:3.0f}%|{bar}| {n_fmt}/{total_fmt} "
-        "[{elapsed}<{remaining}]",
-    )
-    kwargs.setdefault("ascii", True)
-    kwargs.setdefault("mininterval", 0)       # flush every tick
+    kwargs.setdefault("mininterval", 0.5)
+    live = current_live()
+    if "file" not in kwargs and live is not None:
+        kwargs["file"] = io.StringIO()             # only tqdm's closing "\n"
+        return _LiveTqdm(*args, live=live, **kwargs)
     return tqdm(*args, **kwargs)
 
 
-# ---------- safe JSONL writer ------------------------------------------------ #
+# ---------- JSONL encoding ------------------------------------------------- #
+def encode_jsonl(record: dict) -> bytes:
+    """One record → one UTF-8 line (orjson when installed, stdlib otherwise)."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE)
+        except TypeError:                          # exotic types → stdlib
+            pass
+    return (json.dumps(record, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+
+
+# ---------- single-writer JSONL sink ----------------------------------------- #
+_CLOSE = object()
+
+
+class JsonlSink:
+    """
+    Thread-safe JSONL output with exactly one writer thread.
+
+    * `put(seq, records, idx, status)` – called once per dispatched row
+      (records may be empty); never blocks and never touches the file.
+    * The writer thread encodes records, appends them to an in-memory buffer
+      and writes it out in one call every `batch_bytes` / `flush_interval`,
+      with an `fsync` at most every `fsync_interval` seconds and on close.
+    * `ordered=True` holds rows back until every lower `seq` has arrived, so
+      the file follows input order regardless of completion order.
+    * With a `manifest` (utils.manifest) each row's `idx status offset` line
+      is written right after its records, which is what makes resume safe.
+    """
+
+    def __init__(self, path: Path, mode: str = "a", *, ordered: bool = False,
+                 batch_bytes: int = 1 << 20, flush_interval: float = 0.5,
+                 fsync_interval: float = 5.0, manifest=None):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ordered = ordered
+        self.batch_bytes = batch_bytes
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.manifest = manifest
+
+        self.n_records = 0
+        self.bytes_written = 0
+        self.max_queue_depth = 0
+        self.busy_seconds = 0.0                    # encode + write time
+        self._t_open = time.monotonic()
+
+        self._fh = self.path.open(mode + "b" if "b" not in mode else mode)
+        self._q: queue.SimpleQueue = queue.SimpleQueue()
+        self._pending: dict[int, tuple] = {}
+        self._next_seq = 0
+        self._buf = bytearray()
+        self._mbuf = bytearray()
+        self._offset = self._fh.seek(0, os.SEEK_END)
+        self._last_flush = self._last_fsync = time.monotonic()
+        self._error: BaseException | None = None
+        self._thread = threading.Thread(target=self._run, name="jsonl-writer",
+                                        daemon=True)
+        self._thread.start()
+
+    # -- producer side -------------------------------------------------------
+    def put(self, seq: int, records: list[dict], idx: int | None = None,
+            status: str | None = None) -> None:
+        if self._error is not None:
+            raise RuntimeError(f"writer for {self.path} died") from self._error
+        self._q.put((seq, records, idx, status))
+        depth = self._q.qsize()
+        if depth > self.max_queue_depth:
+            self.max_queue_depth = depth
+
+    def stats(self) -> dict:
+        wall = max(1e-9, time.monotonic() - self._t_open)
+        return {"records": self.n_records, "bytes": self.bytes_written,
+                "max_queue_depth": self.max_queue_depth,
+                "busy_fraction": round(self.busy_seconds / wall, 4)}
+
+    def close(self) -> None:
+        self._q.put(_CLOSE)
+        self._thread.join()
+        self._fh.close()
+        if self._error is not None:
+            raise RuntimeError(f"writer for {self.path} died") from self._error
+
+    # -- writer thread -------------------------------------------------------
+    def _run(self) -> None:
+        try:
+            while True:
+                try:
+                    item = self._q.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    item = None
+                if item is _CLOSE:
+                    self._drain_pending()
+                    self._flush(fsync=True)
+                    return
+                t0 = time.monotonic()
+                if item is not None:
+                    self._accept(*item)
+                now = time.monotonic()
+                if (len(self._buf) >= self.batch_bytes
+                        or now - self._last_flush >= self.flush_interval):
+                    self._flush(fsync=now - self._last_fsync >= self.fsync_interval)
+                self.busy_seconds += time.monotonic() - t0
+        except BaseException as e:                 # surfaced on put/close
+            log.exception("JSONL writer for %s failed", self.path)
+            self._error = e
+
+    def _accept(self, seq: int, *row) -> None:
+        if not self.ordered:
+            self._encode(*row)
+            return
+        self._pending[seq] = row
+        while self._next_seq in self._pending:
+            self._encode(*self._pending.pop(self._next_seq))
+            self._next_seq += 1
+
+    def _drain_pending(self) -> None:
+        for seq in sorted(self._pending):          # gaps only after a crash
+            self._encode(*self._pending.pop(seq))
+
+    def _encode(self, records: list[dict], idx: int | None,
+                status: str | None) -> None:
+        for rec in records:
+            line = encode_jsonl(rec)
+            self._buf += line
+            self._offset += len(line)
+        self.n_records += len(records)
+        if self.manifest is not None and idx is not None:
+            self._mbuf += self.manifest.entry(idx, status, self._offset)
+
+    def _flush(self, fsync: bool = False) -> None:
+        if self._buf:
+            self._fh.write(self._buf)
+            self.bytes_written += len(self._buf)
+            self._buf.clear()
+            self._fh.flush()
+        now = time.monotonic()
+        self._last_flush = now
+        if fsync:
+            os.fsync(self._fh.fileno())
+            self._last_fsync = now
+        if self.manifest is not None:              # only after the records
+            self.manifest.write(bytes(self._mbuf), fsync=fsync)
+            self._mbuf.clear()
+
+
 @contextmanager
-def safe_jsonl_writer(path: Path, mode: str = "a", encoding="utf-8"):
-    path.parent.mkdir(parents=True, exist_ok=True)
-    with path.open(mode, encoding=encoding) as fh:
-        yield fh
+def safe_jsonl_writer(path: Path, mode: str = "a", **sink_kw):
+    """`with safe_jsonl_writer(p) as sink: sink.put(seq, records)`"""
+    sink = JsonlSink(path, mode, **sink_kw)
+    try:
+        yield sink
+    finally:
+        sink.close()
+
+
+# ---------- columnar formats ------------------------------------------------- #
+PARQUET_SUFFIXES = {".parquet", ".pq"}
+ARROW_SUFFIXES   = {".arrow", ".feather", ".ipc"}
+TABLE_FORMATS    = {"csv": ".csv", "parquet": ".parquet", "arrow": ".arrow"}
+OUTPUT_COLUMNS   = {"qa":           ["question", "answer", "context"],
+                    "conversation": ["context", "conversation"],
+                    "orpo":         ["context", "conversation"]}
+
+
+def _require_pyarrow() -> None:
+    global pa, pa_ipc, pq
+    if pa is not None:
+        return
+    try:
+        import pyarrow, pyarrow.ipc, pyarrow.parquet
+    except ImportError:
+        raise ImportError("Parquet / Arrow I/O needs `pyarrow` (pip install pyarrow)") from None
+    pa, pa_ipc, pq = pyarrow, pyarrow.ipc, pyarrow.parquet
+
+
+def _turn_type():
+    return pa.struct([("from", pa.string()), ("value", pa.string())])
+
+
+def output_schema(kind: str):
+    """
+    Arrow schema of a pipeline's output records.
+
+    * "qa"           – question / answer / context           (single-sft)
+    * "conversation" – context + list<{question, answer}>    (multi-sft)
+    * "orpo"         – context + {conversations, chosen, rejected}
+                       with ShareGPT-style {from, value} turns  (alignment)
+    """
+    _require_pyarrow()
+    if kind == "qa":
+        return pa.schema([("question", pa.string()), ("answer", pa.string()),
+                          ("context", pa.string())])
+    if kind == "conversation":
+        qa = pa.struct([("question", pa.string()), ("answer", pa.string())])
+        return pa.schema([("context", pa.string()),
+                          ("conversation", pa.list_(qa))])
+    if kind == "orpo":
+        orpo = pa.struct([("conversations", pa.list_(_turn_type())),
+                          ("chosen", _turn_type()),
+                          ("rejected", _turn_type())])
+        return pa.schema([("context", pa.string()), ("conversation", orpo)])
+    raise ValueError(f"unknown output schema {kind!r}")
+
+
+def _sniff(path: Path) -> str:
+    """"jsonl" | "csv" | "parquet" | "arrow" – by suffix, else magic bytes
+    (Streamlit uploads land in suffix-less temp files)."""
+    suffix = path.suffix.lower()
+    if suffix == ".csv":
+        return "csv"
+    if suffix in PARQUET_SUFFIXES:
+        return "parquet"
+    if suffix in ARROW_SUFFIXES:
+        return "arrow"
+    with path.open("rb") as fh:
+        head = fh.read(8)
+    if head[:4] == b"PAR1":
+        return "parquet"
+    if head[:6] == b"ARROW1" or head[:4] == b"\xff\xff\xff\xff":
+        return "arrow"
+    return "jsonl"
+
+
+def _check_columns(path: Path, names: list[str], columns) -> None:
+    missing = [c for c in columns if c not in names]
+    if missing:
+        raise KeyError(f"{path.name}: missing column(s) {missing}")
+
+
+def _iter_parquet(path: Path, columns: tuple[str, ...] | None,
+                  batch_size: int) -> Iterator[dict]:
+    _require_pyarrow()
+    pf = pq.ParquetFile(path)
+    if columns is not None:
+        _check_columns(path, pf.schema_arrow.names, columns)
+    for batch in pf.iter_batches(batch_size=batch_size,
+                                 columns=list(columns) if columns else None):
+        yield from batch.to_pylist()
+
+
+def _iter_arrow(path: Path, columns: tuple[str, ...] | None) -> Iterator[dict]:
+    _require_pyarrow()
+    with pa.memory_map(str(path)) as src:
+        try:
+            reader = pa_ipc.open_file(src)
+            batches = (reader.get_batch(i)
+                       for i in range(reader.num_record_batches))
+        except pa.ArrowInvalid:                    # IPC *stream* format
+            src.seek(0)
+            reader = pa_ipc.open_stream(src)
+            batches = iter(reader)
+        if columns is not None:
+            _check_columns(path, reader.schema.names, columns)
+        for batch in batches:
+            if columns is not None:
+                batch = batch.select(list(columns))
+            yield from batch.to_pylist()
+
+
+def count_records(path: Path | str, max_bytes: int = 256 << 20) -> int | None:
+    """Input rows without decoding them, or None when that is not cheap
+    (CSV – quoted newlines –, Arrow streams, JSONL over `max_bytes`)."""
+    path = Path(path)
+    kind = _sniff(path)
+    if kind == "parquet":
+        _require_pyarrow()
+        return pq.ParquetFile(path).metadata.num_rows
+    if kind == "arrow":
+        _require_pyarrow()
+        with pa.memory_map(str(path)) as src:
+            try:
+                reader = pa_ipc.open_file(src)
+            except pa.ArrowInvalid:                # stream: no footer
+                return None
+            return sum(reader.get_batch(i).num_rows
+                       for i in range(reader.num_record_batches))
+    if kind == "csv" or path.stat().st_size > max_bytes:
+        return None
+    n, last = 0, b"\n"
+    with path.open("rb") as fh:
+        while chunk := fh.read(1 << 20):
+            n += chunk.count(b"\n")
+            last = chunk[-1:]
+    return n + (last != b"\n")                     # no trailing newline
+
+
+# ---------- tabular export ---------------------------------------------------- #
+def _cell(value):
+    """Scalars as-is, nested lists / dicts as JSON (what `iter_records` reads back)."""
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def _export_csv(jsonl_path: Path, fh, columns) -> int:
+    writer, n = None, 0
+    if jsonl_path.exists():
+        for rec in _iter_jsonl(jsonl_path):
+            if writer is None:
+                writer = csv.DictWriter(fh, list(columns or rec),
+                                        extrasaction="ignore")
+                writer.writeheader()
+            writer.writerow({k: _cell(v) for k, v in rec.items()})
+            n += 1
+    if writer is None and columns:
+        csv.writer(fh).writerow(list(columns))
+    return n
+
+
+def _export_columnar(jsonl_path: Path, tmp: Path, fmt: str, schema,
+                     row_group: int) -> int:
+    _require_pyarrow()
+    writer = (pq.ParquetWriter(tmp, schema, compression="zstd")
+              if fmt == "parquet" else pa_ipc.new_file(tmp, schema))
+    n, batch = 0, []
+    try:
+        records = _iter_jsonl(jsonl_path) if jsonl_path.exists() else ()
+        for rec in records:
+            batch.append(rec)
+            if len(batch) >= row_group:
+                writer.write_batch(pa.RecordBatch.from_pylist(batch, schema=schema))
+                n += len(batch)
+                batch.clear()
+        if batch:
+            writer.write_batch(pa.RecordBatch.from_pylist(batch, schema=schema))
+            n += len(batch)
+    finally:
+        writer.close()
+    return n
+
+
+def export_table(jsonl_path: Path, out_path: Path, fmt: str = "csv",
+                 kind: str | None = None, *, row_group: int = 10_000) -> int:
+    """
+    Stream a finished JSONL into a CSV, Parquet or Arrow IPC file without
+    holding it in memory: records are converted in `row_group`-sized batches
+    (CSV row by row).  Parquet / Arrow use `output_schema(kind)`, so nested
+    conversations stay lists of structs; CSV takes the same column names
+    (default: keys of the first record) and JSON-encodes nested values.
+    Written to a temp file and renamed into place.  Returns the row count.
+    """
+    if fmt not in TABLE_FORMATS:
+        raise ValueError(f"table format must be one of {sorted(TABLE_FORMATS)}")
+    jsonl_path, out_path = Path(jsonl_path), Path(out_path)
+    tmp = out_path.with_name(out_path.name + ".tmp")
+    if fmt == "csv":
+        with tmp.open("w", encoding="utf-8", newline="") as fh:
+            n = _export_csv(jsonl_path, fh, OUTPUT_COLUMNS.get(kind))
+    else:
+        if kind is None:
+            raise ValueError(f"{fmt} export needs an output schema kind")
+        n = _export_columnar(jsonl_path, tmp, fmt, output_schema(kind),
+                             row_group)
+    os.replace(tmp, out_path)
+    return n
+
+
+# ---------- streaming readers ------------------------------------------------ #
+def _iter_jsonl(path: Path) -> Iterator[dict]:
+    with path.open("r", encoding="utf-8-sig") as fh:
+        for lineno, line in enumerate(fh, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(
+                    f"{path.name} could not be parsed as JSON-Lines "
+                    f"(line {lineno}: {e.msg}).\n"
+                    "Did you perhaps upload the CSV, or does the file start "
+                    "with a log line?"
+                ) from None
+
+
+def _iter_csv(path: Path) -> Iterator[dict]:
+    csv.field_size_limit(sys.maxsize)          # contexts can be huge
+    with path.open("r", encoding="utf-8-sig", newline="") as fh:
+        yield from csv.DictReader(fh)
+
+
+def iter_records(path: Path | str, columns: Iterable[str] | None = None,
+                 *, batch_size: int = 1024) -> Iterator[dict]:
+    """
+    Lazily yield one dict per input row – never loads the whole file.
+
+    * `.csv`                      → csv.DictReader
+    * `.parquet` / `.pq`          → row-group batches of `batch_size`
+    * `.arrow` / `.feather` / `.ipc` → record batches (file or stream format)
+    * other                       → JSON-Lines; suffix-less uploads are
+                                    sniffed for the Parquet / Arrow magic
+
+    If `columns` is given, every row is projected onto them and a missing
+    column raises `KeyError` on the first row instead of deep in a worker.
+    Parquet / Arrow only decode the projected columns.
+    """
+    path = Path(path)
+    columns = tuple(columns) if columns is not None else None
+    kind = _sniff(path)
+    if kind == "parquet":
+        yield from _iter_parquet(path, columns, batch_size)
+        return
+    if kind == "arrow":
+        yield from _iter_arrow(path, columns)
+        return
+    rows = _iter_csv(path) if kind == "csv" else _iter_jsonl(path)
+    if columns is None:
+        yield from rows
+        return
+    for row in rows:
+        missing = [c for c in columns if c not in row]
+        if missing:
+            raise KeyError(f"{path.name}: missing column(s) {missing}")
+        yield {c: row[c] for c in columns}
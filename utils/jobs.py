@@ -0,0 +1,172 @@
+"""
+Background jobs for the Streamlit UI – one JobManager per server process,
+shared by every browser session.
+
+* JobManager(root, max_jobs)
+    - submit(fields, upload)  – copy the upload in 1 MiB chunks to
+                                `<root>/<id>/input<suffix>`, validate the
+                                Config (output_dir = `<root>/<id>`) and queue
+                                the job; returns its id
+    - resume(id, api_key)     – re-queue a failed / interrupted job with
+                                `resume=True` (the manifest skips done rows)
+    - jobs(limit) / get(id)   – rows of the SQLite job table
+    - live(id)                – the job's LiveLog while this process runs it,
+                                else None (see `log_tail`); dropped as soon
+                                as the job settles, so finished jobs hold no
+                                ring buffer
+    - log_tail(id, n)         – last lines of `<root>/<id>/job.log`
+    - download(id)            – `<output>.jsonl.gz`, compressed once from disk
+                                in chunks, never read into memory whole;
+                                None once the output was removed
+
+Jobs run on a ThreadPoolExecutor of `max_jobs` threads; more are queued.
+Each job thread attaches its own `utils.logger.LiveLog`, so log lines and
+progress of concurrent jobs never mix.  State lives in `<root>/jobs.sqlite`,
+so a page reload (or another user) finds every job again; jobs that were
+queued or running when the process died are marked "interrupted" at
+start-up.  The API key is never written to disk.
+"""
+from __future__ import annotations
+import gzip, json, logging, os, shutil, sqlite3, threading, time, uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import BinaryIO
+
+from utils.logger import LiveLog, attach_live_log, detach_live_log
+from config import Config
+
+log = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED, INTERRUPTED = (
+    "queued", "running", "done", "failed", "interrupted")
+
+_COLUMNS = ("id", "mode", "status", "input_name", "created", "started",
+            "finished", "output_json", "output_table", "records", "error",
+            "config")
+
+
+class JobManager:
+    def __init__(self, root: Path, max_jobs: int = 2, log_lines: int = 400):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.log_lines = log_lines
+        self._pool = ThreadPoolExecutor(max_jobs, thread_name_prefix="job")
+        self._live: dict[str, LiveLog] = {}
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.root / "jobs.sqlite"),
+                                   check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS jobs ("
+                         " id TEXT PRIMARY KEY, mode TEXT, status TEXT,"
+                         " input_name TEXT, created REAL, started REAL,"
+                         " finished REAL, output_json TEXT, output_table TEXT,"
+                         " records INTEGER, error TEXT, config TEXT)")
+        n = self._db.execute("UPDATE jobs SET status = ? WHERE status IN (?, ?)",
+                             (INTERRUPTED, QUEUED, RUNNING)).rowcount
+        if n:
+            log.info("jobs: %s unfinished jobs from a previous run marked "
+                     "interrupted", n)
+
+    # -- table ---------------------------------------------------------------
+    def _update(self, job_id: str, **cols) -> None:
+        sets = ", ".join(f"{k} = ?" for k in cols)
+        with self._lock:
+            self._db.execute(f"UPDATE jobs SET {sets} WHERE id = ?",
+                             (*cols.values(), job_id))
+
+    def get(self, job_id: str) -> dict | None:
+        with self._lock:
+            row = self._db.execute(f"SELECT {', '.join(_COLUMNS)} FROM jobs"
+                                   " WHERE id = ?", (job_id,)).fetchone()
+        return dict(zip(_COLUMNS, row)) if row else None
+
+    def jobs(self, limit: int = 50) -> list[dict]:
+        with self._lock:
+            rows = self._db.execute(f"SELECT {', '.join(_COLUMNS)} FROM jobs"
+                                    " ORDER BY created DESC LIMIT ?",
+                                    (limit,)).fetchall()
+        return [dict(zip(_COLUMNS, r)) for r in rows]
+
+    # -- submit / run ----------------------------------------------------------
+    def submit(self, fields: dict, upload: BinaryIO, name: str) -> str:
+        """Queue a run of `Config(**fields)` on the uploaded file."""
+        job_id = time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+        job_dir = self.root / job_id
+        job_dir.mkdir(parents=True)
+        input_path = job_dir / ("input" + Path(name).suffix.lower())
+        upload.seek(0)
+        with input_path.open("wb") as fh:
+            shutil.copyfileobj(upload, fh, 1 << 20)
+        try:
+            cfg = Config(**fields, input_file=input_path, output_dir=job_dir)
+        except Exception:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            raise
+        stored = json.dumps(cfg.dict(exclude={"api_key"}), default=str)
+        with self._lock:
+            self._db.execute("INSERT INTO jobs (id, mode, status, input_name,"
+                             " created, config) VALUES (?, ?, ?, ?, ?, ?)",
+                             (job_id, cfg.mode, QUEUED, name, time.time(), stored))
+        self._pool.submit(self._run, job_id, cfg)
+        return job_id
+
+    def resume(self, job_id: str, api_key: str) -> None:
+        job = self.get(job_id)
+        if job is None or job["status"] not in (FAILED, INTERRUPTED):
+            raise ValueError(f"job {job_id} cannot be resumed")
+        fields = json.loads(job["config"])
+        fields.update(api_key=api_key, resume=True)
+        cfg = Config(**fields)                      # invalid: job stays as is
+        self._update(job_id, status=QUEUED, error=None, finished=None)
+        self._pool.submit(self._run, job_id, cfg)
+
+    def _run(self, job_id: str, cfg: Config) -> None:
+        from executor import run                     # heavy: on first job only
+
+        live = attach_live_log(self.log_lines, cfg.output_dir / "job.log")
+        self._live[job_id] = live
+        self._update(job_id, status=RUNNING, started=time.time())
+        try:
+            out_table, out_json = run(cfg)
+            with Path(out_json).open("rb") as fh:
+                records = sum(1 for _ in fh)
+            self._update(job_id, status=DONE, finished=time.time(),
+                         output_json=str(out_json), output_table=str(out_table),
+                         records=records)
+        except Exception as e:
+            log.exception("job %s failed", job_id)
+            self._update(job_id, status=FAILED, finished=time.time(),
+                         error=f"{type(e).__name__}: {e}")
+        finally:
+            detach_live_log(live)
+            self._live.pop(job_id, None)         # settled: served by log_tail
+
+    # -- UI helpers ------------------------------------------------------------
+    def live(self, job_id: str) -> LiveLog | None:
+        return self._live.get(job_id)
+
+    def log_tail(self, job_id: str, n: int = 200) -> list[str]:
+        path = self.root / job_id / "job.log"
+        if not path.exists():
+            return []
+        with path.open("rb") as fh:
+            fh.seek(max(0, path.stat().st_size - 256 * n))
+            lines = fh.read().decode("utf-8", "replace").splitlines()
+        return lines[-n:]
+
+    def download(self, job_id: str) -> Path | None:
+        """The job's JSONL gzip-compressed next to it (built once); None when
+        there is no output (any more)."""
+        job = self.get(job_id)
+        if job is None or not job["output_json"]:
+            return None
+        src = Path(job["output_json"])
+        gz = src.with_name(src.name + ".gz")
+        if not src.exists():
+            return gz if gz.exists() else None
+        if not gz.exists() or gz.stat().st_mtime < src.stat().st_mtime:
+            tmp = gz.with_name(gz.name + ".tmp")
+            with src.open("rb") as fi, gzip.open(tmp, "wb", compresslevel=6) as fo:
+                shutil.copyfileobj(fi, fo, 1 << 20)
+            os.replace(tmp, gz)
+        return gz
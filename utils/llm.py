@@ -0,0 +1,499 @@
+"""
+Shared async LLM client + request limits.
+
+* session(cfg, metrics=None)
+                 – async context manager that opens the run's endpoint
+                   pool(s) and sets up the concurrency limits; every call
+                   is recorded in `metrics` (utils.metrics.Metrics)
+* parse(...)     – structured `beta.chat.completions.parse` call → dict
+* parse_n(...)   – the same with `n` samples from one request (the prompt
+                   is prefilled once) → list of dicts
+* complete(...)  – plain chat completion → str
+* chat(...)      – send a prepared /chat/completions body (the bundled
+                   offline batch runner, utils.batch)
+* ping(...)      – one 1-token request through the same client stack
+
+All endpoints of a run (`Config.base_url` + `Config.base_urls`) share one
+tuned httpx connection pool (keep-alive, optional HTTP/2 when `h2` is
+installed – note httpx only negotiates it over https).  Each request is
+routed to a replica by `Config.lb_policy`: "round-robin" or
+"least-outstanding".  `Config.stages[<agent>]` may point an agent at its
+own model and / or base URLs (e.g. a small model for context validation).
+
+Every agent goes through `_send()` → `_slot()`: an optional per-stage
+semaphore caps each agent (`Config.stage_limits`) and a global
+`utils.ratelimit.AdaptiveLimiter` adapts the number of in-flight requests
+(AIMD, up to `Config.max_in_flight`) to 429 / 503 / timeouts / latency.
+Failed attempts are retried with jittered exponential backoff or the
+server's `Retry-After`, within `Config.max_retries` and the per-request
+`Config.request_deadline`; a request that still fails marks its row as
+failed in the manifest, so `resume` picks it up later.
+
+Deterministic calls (temperature 0) go through `_cached()` first: a hit in
+`utils.cache` skips the request, and identical requests already in flight
+are coalesced onto one future.
+
+Chunk locality (`Config.locality_scheduling`): the engine tags each row's
+task with `set_affinity(seq)`.  Waiting requests are admitted lowest `seq`
+first, so all calls of one chunk (validate → generate → validate_qa × n)
+run back-to-back instead of interleaved with newer chunks, and with
+several replicas the chunk sticks to replica `seq % n` (unless that one
+is clearly busier than the rest), so its prompt prefix stays in one
+server's KV cache.
+
+Offline batch mode (`Config.batch_mode`): the session carries a
+`utils.batch.BatchRecorder` and `parse` / `complete` hand it the request
+body instead of sending it – it returns an ingested result or parks the row
+until the next batch round.
+
+The session lives in a ContextVar, so two runs on two event loops (e.g. two
+Streamlit jobs) never share a client.  `openai` / `httpx` are imported and
+`.env` is loaded when the first session (or ping) opens, so importing the
+pipelines stays cheap.
+"""
+from __future__ import annotations
+import asyncio, importlib.util, itertools, json, logging, os, time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from utils.cache import open_cache, make_key
+from utils.metrics import Metrics
+from utils.ratelimit import AdaptiveLimiter, classify, backoff
+from config import Config
+
+if TYPE_CHECKING:
+    import httpx
+    from openai import AsyncOpenAI
+    from utils.batch import BatchRecorder
+
+log = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def _load_env() -> None:
+    """`.env` (LLM_API_KEY / LLM_BASE_URL) – once, before the first client."""
+    try:
+        from dotenv import load_dotenv
+    except ImportError:                            # pragma: no cover
+        return
+    load_dotenv(".env")
+
+
+# ---------- connection pool + load balancing -------------------------------- #
+def _http_client(cfg: Config) -> httpx.AsyncClient:
+    import httpx
+    from openai import DefaultAsyncHttpxClient
+
+    _load_env()
+    http2 = cfg.http2 and importlib.util.find_spec("h2") is not None
+    if cfg.http2 and not http2:
+        log.warning("http2=True but the `h2` package is missing – using HTTP/1.1")
+    return DefaultAsyncHttpxClient(
+        http2=http2,
+        limits=httpx.Limits(max_connections=cfg.max_connections,
+                            max_keepalive_connections=cfg.max_connections,
+                            keepalive_expiry=30.0),
+        timeout=httpx.Timeout(cfg.request_timeout, connect=10.0),
+    )
+
+
+@dataclass
+class _Endpoint:
+    url: str
+    client: AsyncOpenAI
+    outstanding: int = 0
+
+
+_AFFINITY: ContextVar[int | None] = ContextVar("llm_affinity", default=None)
+
+
+def set_affinity(key: int | None) -> None:
+    """Tag the current task's requests (the engine passes the row's seq)."""
+    _AFFINITY.set(key)
+
+
+class _Pool:
+    """One AsyncOpenAI per base URL, all on a single shared httpx pool."""
+
+    def __init__(self, cfg: Config, http: httpx.AsyncClient,
+                 urls: list[str] | None = None):
+        from openai import AsyncOpenAI
+
+        api_key = cfg.api_key or os.environ.get("LLM_API_KEY", "EMPTY")
+        if not urls:
+            urls = [cfg.base_url or os.environ.get("LLM_BASE_URL")]
+            urls += [u for u in cfg.base_urls if u not in urls]
+        self.http = http
+        self.policy = cfg.lb_policy
+        self.sticky = cfg.locality_scheduling
+        self.endpoints = [_Endpoint(u, AsyncOpenAI(api_key=api_key, base_url=u,
+                                                   http_client=http,
+                                                   max_retries=0))
+                          for u in urls]
+        self._rr = itertools.cycle(range(len(self.endpoints)))
+
+    def _pick(self, key: int | None = None) -> _Endpoint:
+        start = next(self._rr)
+        n = len(self.endpoints)
+        least = min((self.endpoints[(start + i) % n] for i in range(n)),
+                    key=lambda ep: ep.outstanding)   # fair ties
+        if self.sticky and key is not None and n > 1:
+            home = self.endpoints[key % n]
+            if home.outstanding <= 2 * least.outstanding + 4:
+                return home
+        if self.policy == "round-robin":
+            return self.endpoints[start]
+        return least
+
+    @contextmanager
+    def use(self, key: int | None = None):
+        ep = self._pick(key)
+        ep.outstanding += 1
+        try:
+            yield ep.client
+        finally:
+            ep.outstanding -= 1
+
+
+
+@dataclass
+class _Session:
+    http: httpx.AsyncClient
+    pool: _Pool
+    model: str
+    limiter: AdaptiveLimiter
+    stage_limits: dict[str, int]
+    timeout: float
+    deadline: float
+    max_retries: int
+    metrics: Metrics
+    locality: bool = True
+    retries: int = 0
+    stage_sems: dict[str, asyncio.Semaphore] = field(default_factory=dict)
+    stage_pools: dict[str, _Pool] = field(default_factory=dict)
+    stage_models: dict[str, str] = field(default_factory=dict)
+    cache: object | None = None
+    inflight: dict[str, asyncio.Future] = field(default_factory=dict)
+    hits: int = 0
+    misses: int = 0
+    batch: BatchRecorder | None = None
+
+    def stage_sem(self, stage: str) -> asyncio.Semaphore | None:
+        if stage not in self.stage_limits:
+            return None
+        if stage not in self.stage_sems:
+            self.stage_sems[stage] = asyncio.Semaphore(self.stage_limits[stage])
+        return self.stage_sems[stage]
+
+    def pool_for(self, stage: str) -> _Pool:
+        return self.stage_pools.get(stage, self.pool)
+
+    def model_for(self, stage: str) -> str:
+        return self.stage_models.get(stage, self.model)
+
+
+_SESSION: ContextVar[_Session | None] = ContextVar("llm_session", default=None)
+
+
+@asynccontextmanager
+async def session(cfg: Config, metrics: Metrics | None = None,
+                  batch: BatchRecorder | None = None):
+    """Open the run-wide endpoint pool(s); must wrap every agent call."""
+    http = _http_client(cfg)
+    sess = _Session(http=http,
+                    pool=_Pool(cfg, http),
+                    model=cfg.model_name,
+                    limiter=AdaptiveLimiter(cfg.max_in_flight,
+                                            latency_target=cfg.latency_target),
+                    stage_limits=dict(cfg.stage_limits),
+                    timeout=cfg.request_timeout,
+                    deadline=cfg.request_deadline,
+                    max_retries=cfg.max_retries,
+                    metrics=metrics if metrics is not None else Metrics(cfg),
+                    locality=cfg.locality_scheduling,
+                    cache=open_cache(cfg),
+                    batch=batch)
+    for stage, sc in cfg.stages.items():           # per-stage model / endpoint
+        if sc.base_urls:
+            sess.stage_pools[stage] = _Pool(cfg, http, sc.base_urls)
+        if sc.model:
+            sess.stage_models[stage] = sc.model
+    token = _SESSION.set(sess)
+    try:
+        yield sess
+    finally:
+        _SESSION.reset(token)
+        await http.aclose()
+        log.info("LLM limiter: final limit %.0f, %s back-offs, %s retries",
+                 sess.limiter.limit, sess.limiter.n_decreases, sess.retries)
+        if sess.cache is not None:
+            sess.cache.close()
+            log.info("LLM cache: %s hits / %s misses", sess.hits, sess.misses)
+
+
+def _current() -> _Session:
+    sess = _SESSION.get()
+    if sess is None:
+        raise RuntimeError("LLM call outside of `utils.llm.session(cfg)`")
+    return sess
+
+
+@asynccontextmanager
+async def _slot(sess: _Session, stage: str):
+    """Wait for the stage + adaptive limits, then lend out an endpoint client."""
+    stage_sem = sess.stage_sem(stage)
+    key = _AFFINITY.get() if sess.locality else None
+    t_wait = time.monotonic()
+    if stage_sem is not None:
+        await stage_sem.acquire()
+    try:
+        await sess.limiter.acquire(priority=key if key is not None else 0)
+        t0 = time.monotonic()
+        sess.metrics.queue_wait(stage, t0 - t_wait)
+        ok = overloaded = False
+        try:
+            with sess.pool_for(stage).use(key) as client:
+                yield client
+            ok = True
+        except Exception as e:
+            _, overloaded, retry_after = classify(e)
+            if retry_after:
+                sess.limiter.pause(retry_after)
+            raise
+        finally:                                  # also on CancelledError
+            await sess.limiter.release(time.monotonic() - t0,
+                                       overloaded=overloaded, ok=ok)
+    finally:
+        if stage_sem is not None:
+            stage_sem.release()
+
+
+async def _send(sess: _Session, stage: str, call):
+    """`await call(client, timeout)` under the limits, retrying on failure."""
+    t0 = time.monotonic()
+    deadline = t0 + sess.deadline
+    with sess.metrics.span(stage) as span:
+        for attempt in itertools.count():
+            timeout = max(0.1, min(sess.timeout, deadline - time.monotonic()))
+            try:
+                async with _slot(sess, stage) as client:
+                    response = await call(client, timeout)
+            except Exception as e:
+                retryable, _, retry_after = classify(e)
+                delay = retry_after if retry_after is not None else backoff(attempt)
+                if (not retryable or attempt >= sess.max_retries
+                        or time.monotonic() + delay >= deadline):
+                    sess.metrics.call_done(stage, time.monotonic() - t0,
+                                           attempt + 1, error=e, span=span)
+                    raise
+                sess.retries += 1
+                sess.metrics.retry(stage)
+                log.debug("%s: attempt %s failed (%s), retrying in %.1fs",
+                          stage, attempt + 1, e, delay)
+                await asyncio.sleep(delay)
+                continue
+            sess.metrics.call_done(stage, time.monotonic() - t0, attempt + 1,
+                                   response=response, span=span)
+            return response
+
+
+async def _cached(sess: _Session, stage: str, key: str | None, fetch,
+                  cacheable=lambda content: content is not None) -> str | None:
+    """`await fetch()` through the response cache; contents `cacheable`
+    rejects (None: refusals, tool-only replies) go to waiters, not the cache."""
+    if key is None or sess.cache is None:
+        return await fetch()
+    while True:
+        hit = sess.cache.get(key)
+        if hit is None and key in sess.inflight:  # coalesce, even onto None
+            fut = sess.inflight[key]
+            try:
+                hit = await asyncio.shield(fut)
+            except asyncio.CancelledError:
+                if fut.cancelled() and not asyncio.current_task().cancelling():
+                    continue                  # the fetching task was cancelled,
+                raise                         # not this one: fetch it ourselves
+            sess.hits += 1
+            sess.metrics.cache_hit(stage)
+            return hit
+        if hit is not None:
+            sess.hits += 1
+            sess.metrics.cache_hit(stage)
+            return hit
+        break
+
+    sess.misses += 1
+    fut = asyncio.get_running_loop().create_future()
+    sess.inflight[key] = fut
+    try:
+        content = await fetch()
+    except asyncio.CancelledError:
+        fut.cancel()                         # waiters refetch instead
+        raise
+    except BaseException as e:
+        fut.set_exception(e)
+        fut.exception()                      # waiters re-raise; no warning
+        raise
+    finally:
+        sess.inflight.pop(key, None)
+    fut.set_result(content)
+    if cacheable(content):
+        sess.cache.set(key, content)
+    return content
+
+
+def _json_schema(response_format) -> dict:
+    """`response_format` of a Batch request body for a pydantic model."""
+    return {"type": "json_schema",
+            "json_schema": {"name": response_format.__name__,
+                            "schema": response_format.model_json_schema()}}
+
+
+# ---------- public calls ---------------------------------------------------- #
+async def parse(stage: str, messages: list[dict], response_format,
+                temperature: float = 0.0) -> dict:
+    """Structured-output call; returns the decoded JSON object."""
+    sess = _current()
+    model = sess.model_for(stage)
+    if sess.batch is not None:                     # offline: utils.batch
+        return json.loads(sess.batch.call(stage, {
+            "model": model, "messages": messages, "temperature": temperature,
+            "response_format": _json_schema(response_format),
+            "guided_decoding_backend": "outlines"}))
+    key = (make_key(model, messages, {"temperature": temperature},
+                    response_format.model_json_schema())
+           if temperature == 0 else None)
+
+    async def _call(client: AsyncOpenAI, timeout: float):
+        return await client.beta.chat.completions.parse(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            response_format=response_format,
+            extra_body=dict(guided_decoding_backend="outlines"),
+            timeout=timeout,
+        )
+
+    async def _fetch() -> str:
+        response = await _send(sess, stage, _call)
+        return response.choices[0].message.content
+
+    return json.loads(await _cached(sess, stage, key, _fetch))
+
+
+async def parse_n(stage: str, messages: list[dict], response_format, n: int,
+                  temperature: float = 0.7) -> list[dict]:
+    """`n` structured samples of one prompt in one request; every choice decoded."""
+    if n == 1:
+        return [await parse(stage, messages, response_format, temperature)]
+    sess = _current()
+    model = sess.model_for(stage)
+    if sess.batch is not None:                     # offline: utils.batch
+        raw = json.loads(sess.batch.call(stage, {
+            "model": model, "messages": messages, "temperature": temperature,
+            "n": n, "response_format": _json_schema(response_format),
+            "guided_decoding_backend": "outlines"}))
+        return [json.loads(c) for c in raw] if isinstance(raw, list) else [raw]
+    key = (make_key(model, messages, {"temperature": temperature, "n": n},
+                    response_format.model_json_schema())
+           if temperature == 0 else None)
+
+    async def _call(client: AsyncOpenAI, timeout: float):
+        return await client.beta.chat.completions.parse(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            n=n,
+            response_format=response_format,
+            extra_body=dict(guided_decoding_backend="outlines"),
+            timeout=timeout,
+        )
+
+    async def _fetch() -> str:
+        response = await _send(sess, stage, _call)
+        return json.dumps([c.message.content for c in response.choices])
+
+    contents = json.loads(await _cached(sess, stage, key, _fetch,
+                                        lambda c: None not in json.loads(c)))
+    return [json.loads(c) for c in contents if c is not None]
+
+
+async def complete(stage: str, messages: list[dict],
+                   temperature: float = 0.0) -> str:
+    """Free-text call; returns the message content."""
+    sess = _current()
+    model = sess.model_for(stage)
+    if sess.batch is not None:                     # offline: utils.batch
+        return sess.batch.call(stage, {"model": model, "messages": messages,
+                                       "temperature": temperature})
+    key = (make_key(model, messages, {"temperature": temperature})
+           if temperature == 0 else None)
+
+    async def _call(client: AsyncOpenAI, timeout: float):
+        return await client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            timeout=timeout,
+        )
+
+    async def _fetch() -> str:
+        response = await _send(sess, stage, _call)
+        return response.choices[0].message.content
+
+    return await _cached(sess, stage, key, _fetch)
+
+
+_SDK_ARGS = {"model", "messages", "temperature", "response_format", "n",
+             "max_tokens", "top_p", "seed", "stop"}
+
+
+async def chat(stage: str, body: dict):
+    """Send a prepared request body as is; returns the ChatCompletion.
+    Keys the SDK does not know (e.g. `guided_decoding_backend`) go in
+    `extra_body`."""
+    sess = _current()
+    known = {k: v for k, v in body.items() if k in _SDK_ARGS}
+    extra = {k: v for k, v in body.items() if k not in _SDK_ARGS}
+
+    async def _call(client: AsyncOpenAI, timeout: float):
+        return await client.chat.completions.create(
+            **known, extra_body=extra or None, timeout=timeout)
+
+    return await _send(sess, stage, _call)
+
+
+# ---------- health check ---------------------------------------------------- #
+def ping(base_url: str, api_key: str, model: str,
+         timeout: float = 5.0) -> tuple[bool, str]:
+    """Return (ok?, message) after one 1-token /chat/completions call."""
+    cfg = Config(model_name=model, api_key=api_key, base_url=base_url,
+                 mode="single-sft", input_file=Path(os.devnull),
+                 request_timeout=timeout)
+
+    async def _one() -> tuple[bool, str]:
+        from openai import APIStatusError
+
+        http = _http_client(cfg)
+        pool = _Pool(cfg, http)
+        try:
+            with pool.use() as client:
+                await client.chat.completions.create(
+                    model=model,
+                    messages=[{"role": "user", "content": "ping"}],
+                    max_tokens=1,
+                    temperature=0.0,
+                )
+            return True, "200 OK"
+        except APIStatusError as e:
+            return False, f"{e.status_code} {e.message[:60]}"
+        except Exception as e:
+            return False, str(e)
+        finally:
+            await http.aclose()
+
+    return asyncio.run(_one())
@@ -1,43 +1,118 @@
 """
 Shared logging helpers.
 
-* init_root()           – set a single stdout handler for the whole app
-* get_stream_handler()  – attach a second handler that writes to an
-                          in-memory StringIO; returns (handler, buffer)
-* remove_stream_handler() – detach the buffer handler
+* init_root()            – set a single stdout handler for the whole app
+* attach_live_log(n, path)
+                         – give the *current context* (thread / task) its own
+                           LiveLog for a UI to poll; returns it
+* detach_live_log(hdl)   – detach it again (and close its log file)
+* current_live()         – the LiveLog of the current context, or None
+* LiveLog                – bounded view of a running job:
+    - the last `maxlen` formatted log lines (ring buffer), optionally also
+      appended to `path`
+    - the latest progress state per bar (n, total, rate, elapsed, eta),
+      published by `utils.io.tqdm_std` at most every `mininterval` seconds
+    - snapshot() → (version, lines, progress); `version` only changes when
+      something new arrived, so a poller can skip redundant redraws
 
-The global CURRENT_LOG_BUF is updated so other modules (tqdm wrapper)
-can write progress into the same buffer.
+The LiveLog lives in a ContextVar and one root handler routes each record
+to the LiveLog of the context that logged it – asyncio tasks and
+`to_thread` calls inherit it – so concurrent jobs (utils.jobs) never see
+each other's lines.  Memory and per-poll cost are bounded by `maxlen`, not
+by the length of the run.
 """
 from __future__ import annotations
-import io, logging, sys
+import logging, sys, threading
+from collections import deque
+from contextvars import ContextVar
+from pathlib import Path
 
-# --------------------------------------------------------------------------- #
-CURRENT_LOG_BUF: io.StringIO | None = None    # ←  NEEDED GLOBALLY
-# --------------------------------------------------------------------------- #
+_FMT = "%(asctime)s | %(levelname)8s | %(name)s | %(message)s"
+
+_LIVE: ContextVar["LiveLog | None"] = ContextVar("live_log", default=None)
 
 
 def init_root(level: int = logging.INFO) -> None:
     """Call once, early, to configure the root logger."""
-    if not logging.getLogger().handlers:
+    root = logging.getLogger()
+    if not [h for h in root.handlers if h is not _ROUTER]:
         hdl = logging.StreamHandler(sys.stdout)
-        fmt = "%(asctime)s | %(levelname)8s | %(name)s | %(message)s"
-        hdl.setFormatter(logging.Formatter(fmt))
-        logging.basicConfig(level=level, handlers=[hdl])
-
-
-def get_stream_handler() -> tuple[logging.Handler, io.StringIO]:
-    """Attach a temporary StreamHandler that logs into a StringIO buffer."""
-    global CURRENT_LOG_BUF
-    buf = io.StringIO()
-    hdl = logging.StreamHandler(buf)
-    logging.getLogger().addHandler(hdl)
-    CURRENT_LOG_BUF = buf           # ★ share with tqdm wrapper
-    return hdl, buf
-
-
-def remove_stream_handler(hdl: logging.Handler) -> None:
-    """Detach the temporary handler and clear the global pointer."""
-    global CURRENT_LOG_BUF
-    logging.getLogger().removeHandler(hdl)
-    CURRENT_LOG_BUF = None
+        hdl.setFormatter(logging.Formatter(_FMT))
+        root.addHandler(hdl)
+        root.setLevel(level)
+
+
+class LiveLog(logging.Handler):
+    def __init__(self, maxlen: int = 500, path: Path | None = None):
+        super().__init__()
+        self.setFormatter(logging.Formatter(_FMT))
+        self.lines: deque[str] = deque(maxlen=maxlen)
+        self.n_lines = 0                            # incl. the ones rotated out
+        self.progress: dict[str, dict] = {}
+        self.version = 0
+        self._lock = threading.Lock()
+        self._fh = path.open("a", encoding="utf-8", buffering=1) if path else None
+        self._token = None
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            line = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+        with self._lock:
+            self.lines.append(line)
+            self.n_lines += 1
+            self.version += 1
+            if self._fh is not None:
+                self._fh.write(line + "\n")
+
+    def publish(self, desc: str, **state) -> None:
+        with self._lock:
+            self.progress[desc] = state
+            self.version += 1
+
+    def snapshot(self) -> tuple[int, list[str], dict[str, dict]]:
+        with self._lock:
+            return self.version, list(self.lines), dict(self.progress)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+        super().close()
+
+
+class _Router(logging.Handler):
+    """Root handler forwarding each record to the context's LiveLog."""
+
+    def emit(self, record: logging.LogRecord) -> None:
+        live = _LIVE.get()
+        if live is not None:
+            live.handle(record)
+
+
+_ROUTER = _Router()
+
+
+def current_live() -> LiveLog | None:
+    return _LIVE.get()
+
+
+def attach_live_log(maxlen: int = 500, path: Path | None = None) -> LiveLog:
+    """Route this context's log records and progress into a new LiveLog."""
+    root = logging.getLogger()
+    if _ROUTER not in root.handlers:
+        root.addHandler(_ROUTER)
+    hdl = LiveLog(maxlen, path)
+    hdl._token = _LIVE.set(hdl)
+    return hdl
+
+
+def detach_live_log(hdl: LiveLog) -> None:
+    """Stop routing into `hdl` (call from the context that attached it)."""
+    if hdl._token is not None:
+        _LIVE.reset(hdl._token)
+        hdl._token = None
+    hdl.close()
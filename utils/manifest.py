@@ -0,0 +1,99 @@
+"""
+Append-only run manifest that makes every pipeline resumable.
+
+One text line per finished input row, next to the JSONL output:
+
+    <idx> <status> <offset>\n
+
+* status – A accepted · R rejected by validate_context · F failed
+* offset – size of the JSONL file once this row's records were written
+
+The JSONL sink appends manifest lines only *after* the matching records, so
+on resume the output is truncated back to the last recorded offset (dropping
+records of rows that never made it into the manifest) and no row is ever
+paid for or written twice.  Without `resume` both files start empty – an
+old JSONL is never left behind a fresh manifest.  Statuses live in a bytearray indexed by row, so
+the skip check is O(1) and costs one byte per input row.
+"""
+from __future__ import annotations
+import logging, os
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+
+ACCEPTED, REJECTED, FAILED = "A", "R", "F"
+_DONE = {ord(ACCEPTED), ord(REJECTED)}          # failed rows are retried
+
+
+def manifest_path(out_json: Path) -> Path:
+    return out_json.with_suffix(".manifest")
+
+
+class Manifest:
+    def __init__(self, out_json: Path, resume: bool = False):
+        self.path = manifest_path(out_json)
+        self.status = bytearray()
+        if resume and self.path.exists():
+            self._load(out_json)
+        else:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.path.write_bytes(b"")
+            if out_json.exists() and out_json.stat().st_size:
+                # nothing of it is in the (new) manifest: start it over too
+                log.info("fresh run: truncating existing %s", out_json.name)
+                out_json.write_bytes(b"")
+        self._fh = self.path.open("ab")
+
+    # -- load / repair -------------------------------------------------------
+    def _load(self, out_json: Path) -> None:
+        size = out_json.stat().st_size if out_json.exists() else 0
+        keep, last_offset = 0, 0
+        with self.path.open("rb") as fh:
+            for line in fh:
+                parts = line.split()
+                if not line.endswith(b"\n") or len(parts) != 3:
+                    break                            # torn last line
+                idx, status, offset = int(parts[0]), parts[1][0], int(parts[2])
+                if offset > size:
+                    break                            # records never hit disk
+                self._set(idx, status)
+                keep += len(line)
+                last_offset = offset
+
+        with self.path.open("r+b") as fh:            # drop torn / lost tail
+            fh.truncate(keep)
+        if size > last_offset:
+            with out_json.open("r+b") as fh:         # drop unacknowledged rows
+                fh.truncate(last_offset)
+            log.info("resume: truncated %s from %s to %s bytes",
+                     out_json.name, size, last_offset)
+        c = self.counts()
+        log.info("resume: %s accepted, %s rejected done; %s failed will be retried",
+                 c[ACCEPTED], c[REJECTED], c[FAILED])
+
+    def _set(self, idx: int, status: int) -> None:
+        if idx >= len(self.status):
+            self.status.extend(bytes(idx + 1 - len(self.status)))
+        self.status[idx] = status
+
+    # -- queries -------------------------------------------------------------
+    def is_done(self, idx: int) -> bool:
+        return idx < len(self.status) and self.status[idx] in _DONE
+
+    def counts(self) -> dict[str, int]:
+        return {s: self.status.count(ord(s)) for s in (ACCEPTED, REJECTED, FAILED)}
+
+    # -- writer side (called from the JSONL writer thread only) --------------
+    def entry(self, idx: int, status: str, offset: int) -> bytes:
+        self._set(idx, ord(status))
+        return f"{idx} {status} {offset}\n".encode()
+
+    def write(self, data: bytes, fsync: bool = False) -> None:
+        if data:
+            self._fh.write(data)
+            self._fh.flush()
+        if fsync:
+            os.fsync(self._fh.fileno())
+
+    def close(self) -> None:
+        self._fh.close()
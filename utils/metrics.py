@@ -0,0 +1,246 @@
+"""
+Per-stage instrumentation of agent calls and pipeline stages.
+
+* Metrics(cfg)           – one per run, filled by `utils.llm` and
+                           `utils.engine` on the event-loop thread
+    - per agent (`llm.parse/complete` stage name): calls, ok / failed,
+      retries, cache hits, prompt / completion tokens (`response.usage`),
+      histograms of call wall time (retries included) and queue wait
+      (stage cap + adaptive limiter), error types; offline batch results
+      (utils.batch) count via `ingested()`
+    - per engine stage: histogram of step time, rows in / out
+    - summary()          – the dict that lands in `<out>.summary.json`,
+                           incl. an estimated cost from the `price_*` knobs
+* Histogram              – fixed log-spaced buckets, bucket-interpolated
+                           quantiles
+
+Optional exporters (off, with a warning, when their package is missing):
+
+* Prometheus  – `Config.metrics_port` serves `/metrics` via
+                `prometheus_client` (llm_calls_total, llm_tokens_total,
+                llm_call_seconds, llm_queue_wait_seconds, stage_step_seconds)
+* OpenTelemetry – `Config.otel_tracing` opens one span per agent call via
+                `opentelemetry-api`; exporters come from the usual OTEL_*
+                environment / `opentelemetry-instrument`
+"""
+from __future__ import annotations
+import bisect, logging, math
+from collections import Counter, defaultdict
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+
+from config import Config
+
+try:                                               # optional exporters
+    import prometheus_client as prom
+except ImportError:                                # pragma: no cover
+    prom = None
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:                                # pragma: no cover
+    otel_trace = None
+
+log = logging.getLogger(__name__)
+
+_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60,
+            120, 300, math.inf)
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...] = _BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.n = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.n += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        if not self.n:
+            return 0.0
+        rank, seen, lo = q * self.n, 0, 0.0
+        for hi, c in zip(self.buckets, self.counts):
+            if c and seen + c >= rank:
+                hi = min(hi, self.max)
+                return lo + (hi - lo) * (rank - seen) / c
+            seen += c
+            lo = hi
+        return self.max
+
+    def summary(self) -> dict:
+        r = lambda v: round(v, 4)
+        return {"count": self.n, "mean": r(self.total / self.n) if self.n else 0.0,
+                "p50": r(self.quantile(0.5)), "p90": r(self.quantile(0.9)),
+                "p99": r(self.quantile(0.99)), "max": r(self.max),
+                "total": r(self.total)}
+
+
+@dataclass
+class AgentMetrics:
+    calls: int = 0
+    ok: int = 0
+    failed: int = 0
+    retries: int = 0
+    cache_hits: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    latency: Histogram = field(default_factory=Histogram)
+    queue_wait: Histogram = field(default_factory=Histogram)
+    errors: Counter = field(default_factory=Counter)
+
+    def summary(self) -> dict:
+        return {"calls": self.calls, "ok": self.ok, "failed": self.failed,
+                "retries": self.retries, "cache_hits": self.cache_hits,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "latency_s": self.latency.summary(),
+                "queue_wait_s": self.queue_wait.summary(),
+                "errors": dict(self.errors)}
+
+
+@dataclass
+class StageMetrics:
+    rows_in: int = 0
+    rows_out: int = 0
+    step: Histogram = field(default_factory=Histogram)
+
+    def summary(self) -> dict:
+        return {"rows_in": self.rows_in, "rows_out": self.rows_out,
+                "step_s": self.step.summary()}
+
+
+# ---------- Prometheus (process-wide; created once) -------------------------- #
+_PROM: dict | None = None
+
+
+def _prometheus(port: int) -> dict | None:
+    global _PROM
+    if prom is None:
+        log.warning("metrics_port set but `prometheus_client` is not installed")
+        return None
+    if _PROM is None:
+        _PROM = {
+            "calls":   prom.Counter("llm_calls", "Agent calls", ["stage", "outcome"]),
+            "retries": prom.Counter("llm_retries", "Retried attempts", ["stage"]),
+            "tokens":  prom.Counter("llm_tokens", "Tokens used", ["stage", "kind"]),
+            "latency": prom.Histogram("llm_call_seconds", "Call wall time",
+                                      ["stage"], buckets=_BUCKETS),
+            "wait":    prom.Histogram("llm_queue_wait_seconds", "Wait for a slot",
+                                      ["stage"], buckets=_BUCKETS),
+            "step":    prom.Histogram("stage_step_seconds", "Engine stage step",
+                                      ["stage"], buckets=_BUCKETS),
+        }
+        prom.start_http_server(port)
+        log.info("Prometheus metrics on :%s/metrics", port)
+    return _PROM
+
+
+class Metrics:
+    def __init__(self, cfg: Config | None = None):
+        self.agents: defaultdict[str, AgentMetrics] = defaultdict(AgentMetrics)
+        self.stages: defaultdict[str, StageMetrics] = defaultdict(StageMetrics)
+        self.price_prompt = cfg.price_prompt_per_mtok if cfg else 0.0
+        self.price_completion = cfg.price_completion_per_mtok if cfg else 0.0
+        self._prom = _prometheus(cfg.metrics_port) if cfg and cfg.metrics_port else None
+        self._tracer = None
+        if cfg is not None and cfg.otel_tracing:
+            if otel_trace is None:
+                log.warning("otel_tracing set but `opentelemetry-api` is not installed")
+            else:
+                self._tracer = otel_trace.get_tracer("data-augmentation-toolkit")
+
+    # -- agent calls (utils.llm) -------------------------------------------
+    def span(self, stage: str):
+        if self._tracer is None:
+            return nullcontext(None)
+        return self._tracer.start_as_current_span(f"llm.{stage}")
+
+    def queue_wait(self, stage: str, seconds: float) -> None:
+        self.agents[stage].queue_wait.observe(seconds)
+        if self._prom:
+            self._prom["wait"].labels(stage).observe(seconds)
+
+    def retry(self, stage: str) -> None:
+        self.agents[stage].retries += 1
+        if self._prom:
+            self._prom["retries"].labels(stage).inc()
+
+    def cache_hit(self, stage: str) -> None:
+        self.agents[stage].cache_hits += 1
+        if self._prom:
+            self._prom["calls"].labels(stage, "cache_hit").inc()
+
+    def call_done(self, stage: str, seconds: float, attempts: int,
+                  response=None, error: BaseException | None = None,
+                  span=None) -> None:
+        a = self.agents[stage]
+        a.calls += 1
+        a.latency.observe(seconds)
+        usage = getattr(response, "usage", None)
+        p = getattr(usage, "prompt_tokens", 0) or 0
+        c = getattr(usage, "completion_tokens", 0) or 0
+        a.prompt_tokens += p
+        a.completion_tokens += c
+        outcome = "ok" if error is None else "failed"
+        if error is None:
+            a.ok += 1
+        else:
+            a.failed += 1
+            a.errors[type(error).__name__] += 1
+        if self._prom:
+            self._prom["calls"].labels(stage, outcome).inc()
+            self._prom["latency"].labels(stage).observe(seconds)
+            self._prom["tokens"].labels(stage, "prompt").inc(p)
+            self._prom["tokens"].labels(stage, "completion").inc(c)
+        if span is not None:
+            span.set_attribute("llm.stage", stage)
+            span.set_attribute("llm.attempts", attempts)
+            span.set_attribute("llm.outcome", outcome)
+            span.set_attribute("llm.prompt_tokens", p)
+            span.set_attribute("llm.completion_tokens", c)
+
+    def ingested(self, stage: str, usage: dict | None,
+                 error: str | None = None) -> None:
+        """One result line of an offline batch (utils.batch); no latency."""
+        a = self.agents[stage]
+        a.calls += 1
+        p = (usage or {}).get("prompt_tokens") or 0
+        c = (usage or {}).get("completion_tokens") or 0
+        a.prompt_tokens += p
+        a.completion_tokens += c
+        if error is None:
+            a.ok += 1
+        else:
+            a.failed += 1
+            a.errors[error] += 1
+        if self._prom:
+            self._prom["calls"].labels(stage, "ok" if error is None else "failed").inc()
+            self._prom["tokens"].labels(stage, "prompt").inc(p)
+            self._prom["tokens"].labels(stage, "completion").inc(c)
+
+    # -- engine stages (utils.engine) --------------------------------------
+    def stage_step(self, stage: str, seconds: float, rows_in: int,
+                   rows_out: int) -> None:
+        s = self.stages[stage]
+        s.step.observe(seconds)
+        s.rows_in += rows_in
+        s.rows_out += rows_out
+        if self._prom:
+            self._prom["step"].labels(stage).observe(seconds)
+
+    # -- report --------------------------------------------------------------
+    def summary(self) -> dict:
+        prompt = sum(a.prompt_tokens for a in self.agents.values())
+        completion = sum(a.completion_tokens for a in self.agents.values())
+        out = {"agents": {k: v.summary() for k, v in sorted(self.agents.items())},
+               "stages": {k: v.summary() for k, v in self.stages.items()},
+               "tokens": {"prompt": prompt, "completion": completion}}
+        if self.price_prompt or self.price_completion:
+            out["estimated_cost"] = round(prompt / 1e6 * self.price_prompt
+                                          + completion / 1e6 * self.price_completion, 4)
+        return out
@@ -0,0 +1,124 @@
+"""
+Local heuristic pre-filter – rejects obviously useless chunks before the
+LLM context validator sees them.
+
+* Prefilter(opts)       – thresholds from `config.PrefilterConfig`
+    - reasons(texts)    – one rule name (or None = keep) per text; the
+                          features of a whole batch are computed into numpy
+                          arrays and every rule is one vectorised compare
+    - counts            – Counter of rejections per rule
+* prefilter_stage(cfg, pf)
+                        – `utils.engine.Stage` named "prefilter" that runs
+                          `reasons` over up to 256 queued chunks at a time
+                          (`Config.stages["prefilter"]` to change)
+
+Rules, checked in this order (first hit is the reported reason):
+
+    too_short / too_long   characters, words
+    low_alpha              letters / non-space chars   (markup, symbols)
+    numeric                digits  / non-space chars   (tables of numbers)
+    symbols                punctuation / non-space chars
+    repeated_lines         duplicate lines / lines
+    repetitive             unique words / words
+    boilerplate            short lines (< 4 words) / lines  – menus, footers
+    language               not in `languages` (needs the optional `langid`)
+"""
+from __future__ import annotations
+import logging, re
+from collections import Counter
+
+import numpy as np
+
+from utils.engine import Stage
+from config import Config, PrefilterConfig
+
+try:                                               # optional language ID
+    import langid
+except ImportError:                                # pragma: no cover
+    langid = None
+
+log = logging.getLogger(__name__)
+
+_SPACE  = re.compile(r"\s+")
+_LETTER = re.compile(r"[^\W\d_]")
+_DIGIT  = re.compile(r"\d")
+_SYMBOL = re.compile(r"[^\w\s]")
+_WORD   = re.compile(r"\w+")
+
+
+def _count(pattern: re.Pattern, text: str) -> int:
+    return len(text) - len(pattern.sub("", text))
+
+
+class Prefilter:
+    def __init__(self, opts: PrefilterConfig):
+        self.opts = opts
+        self.counts: Counter[str] = Counter()
+        self.n_seen = 0
+        self.languages = set(opts.languages or ())
+        if self.languages and langid is None:
+            log.warning("prefilter.languages set but `langid` is not "
+                        "installed – skipping the language rule")
+            self.languages = set()
+
+    def _features(self, texts: list[str]) -> dict[str, np.ndarray]:
+        n = len(texts)
+        f = {k: np.zeros(n) for k in ("chars", "nonspace", "letters", "digits",
+                                      "symbols", "words", "unique", "lines",
+                                      "dup_lines", "short_lines")}
+        for i, t in enumerate(texts):
+            words = _WORD.findall(t.lower())
+            lines = [ln.strip() for ln in t.splitlines() if ln.strip()]
+            f["chars"][i]       = len(t)
+            f["nonspace"][i]    = len(t) - _count(_SPACE, t)
+            f["letters"][i]     = _count(_LETTER, t)
+            f["digits"][i]      = _count(_DIGIT, t)
+            f["symbols"][i]     = _count(_SYMBOL, t)
+            f["words"][i]       = len(words)
+            f["unique"][i]      = len(set(words))
+            f["lines"][i]       = len(lines)
+            f["dup_lines"][i]   = len(lines) - len(set(lines))
+            f["short_lines"][i] = sum(len(ln.split()) < 4 for ln in lines)
+        return f
+
+    def reasons(self, texts: list[str]) -> list[str | None]:
+        o, f = self.opts, self._features(texts)
+        nonspace = np.maximum(f["nonspace"], 1)
+        lines, words = np.maximum(f["lines"], 1), np.maximum(f["words"], 1)
+        many_lines = f["lines"] >= 5
+        rules = [
+            ("too_short",      (f["chars"] < o.min_chars) | (f["words"] < o.min_words)),
+            ("too_long",       f["chars"] > (o.max_chars or np.inf)),
+            ("low_alpha",      f["letters"] / nonspace < o.min_alpha_ratio),
+            ("numeric",        f["digits"] / nonspace > o.max_digit_ratio),
+            ("symbols",        f["symbols"] / nonspace > o.max_symbol_ratio),
+            ("repeated_lines", many_lines & (f["dup_lines"] / lines > o.max_dup_line_ratio)),
+            ("repetitive",     f["unique"] / words < o.min_unique_word_ratio),
+            ("boilerplate",    many_lines & (f["short_lines"] / lines > o.max_short_line_ratio)),
+        ]
+        out: list[str | None] = [None] * len(texts)
+        for name, hit in rules:
+            for i in np.flatnonzero(hit):
+                if out[i] is None:
+                    out[i] = name
+        if self.languages:
+            for i, t in enumerate(texts):
+                if out[i] is None and langid.classify(t)[0] not in self.languages:
+                    out[i] = "language"
+        self.n_seen += len(texts)
+        self.counts.update(r for r in out if r is not None)
+        return out
+
+    def log_counts(self) -> None:
+        log.info("prefilter: rejected %s / %s chunks %s", sum(self.counts.values()),
+                 self.n_seen, dict(self.counts.most_common()))
+
+
+def prefilter_stage(cfg: Config, pf: Prefilter) -> Stage:
+    """Batched first stage: passes the chunk through, or None (rejected)."""
+    async def _batch(batch: list[tuple[int, str]]) -> list[str | None]:
+        texts = [text for _, text in batch]
+        return [None if r else t for t, r in zip(texts, pf.reasons(texts))]
+
+    return Stage.from_config(cfg, "prefilter", batch_fn=_batch, concurrency=1,
+                             batch_size=256, queue_size=512)
@@ -0,0 +1,56 @@
+"""
+Prompt layout shared by every agent, arranged for server-side prefix caching
+(vLLM automatic prefix caching, OpenAI prompt caching).
+
+    build(system, task, shared=[...], variable=[...]) → [system, user]
+    Template(system, task).build(shared=..., variable=...)
+                                                     – same, header joined once
+
+The user message is laid out static → shared → variable:
+
+    <task>                         fixed per agent
+    <REMINDER>                     fixed for all agents
+    <label>:\\n<value>              `shared`   – repeated across calls
+    <label>:\\n<value>              `variable` – unique per call, always last
+
+so two calls with the same agent and the same `shared` values produce
+byte-identical prefixes up to the first variable field.  `shared` is for
+content several calls have in common, e.g. the chunk that `validate_qa`
+sends once per QA pair.  Values are inserted verbatim; lists / dicts are
+JSON-encoded with a stable key order.
+"""
+from __future__ import annotations
+import json
+from typing import Any, Sequence
+
+REMINDER = ("Don't deviate from the instructions otherwise you will be "
+            "penalized heavily.")
+
+Fields = Sequence[tuple[str, Any]]
+
+
+def _field(label: str, value: Any) -> str:
+    if not isinstance(value, str):
+        value = json.dumps(value, ensure_ascii=False, sort_keys=True)
+    return f"{label}:\n{value}"
+
+
+class Template:
+    """One agent's prompt with the static part pre-rendered."""
+    __slots__ = ("system", "head")
+
+    def __init__(self, system: str, task: str):
+        self.system = system
+        self.head = f"{task.strip()}\n\n{REMINDER}"
+
+    def build(self, *, shared: Fields = (), variable: Fields = ()) -> list[dict]:
+        parts = [self.head]
+        parts += [_field(k, v) for k, v in shared]
+        parts += [_field(k, v) for k, v in variable]
+        return [{"role": "system", "content": self.system},
+                {"role": "user", "content": "\n\n".join(parts)}]
+
+
+def build(system: str, task: str, *, shared: Fields = (),
+          variable: Fields = ()) -> list[dict]:
+    return Template(system, task).build(shared=shared, variable=variable)
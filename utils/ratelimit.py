@@ -0,0 +1,138 @@
+"""
+Adaptive concurrency control + retry policy for LLM requests.
+
+* AdaptiveLimiter – AIMD window on the number of in-flight requests:
+    - slow start: +1 per success until the first sign of overload
+    - afterwards:  +1/limit per success (≈ +1 per round-trip)
+    - overload (429 / 503 / 504 / timeout, or latency above
+      `latency_target`): limit × 0.5, at most once per round-trip
+    - `Retry-After` pauses *all* new requests until it expires
+    - waiters are admitted by `priority` (lowest first, FIFO on ties) –
+      `utils.llm` passes the row's dispatch order, so requests of one
+      chunk run close together in time
+* classify(exc)   – (retryable?, overloaded?, retry_after seconds | None)
+* backoff(n)      – full-jitter exponential delay for attempt n
+"""
+from __future__ import annotations
+import asyncio, heapq, itertools, random, time
+from email.utils import parsedate_to_datetime
+
+_RETRY_STATUS    = {408, 409, 429, 500, 502, 503, 504}
+_OVERLOAD_STATUS = {429, 503, 504}
+
+
+class AdaptiveLimiter:
+    def __init__(self, max_limit: int, min_limit: int = 1,
+                 latency_target: float | None = None):
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.latency_target = latency_target
+        self.limit = float(min(self.max_limit, 8))
+        self.slow_start = True
+        self.inflight = 0
+        self.n_decreases = 0
+        self._last_decrease = 0.0
+        self._rtt = 1.0                               # EWMA of latency
+        self._pause_until = 0.0
+        self._waiters: list[tuple[float, int, asyncio.Future]] = []
+        self._tick = itertools.count()
+        self._timer: asyncio.TimerHandle | None = None
+
+    # -- acquire / release ---------------------------------------------------
+    async def acquire(self, priority: float = 0.0) -> None:
+        """Wait for a slot; lower `priority` is admitted first (FIFO on ties)."""
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._tick), fut))
+        self._wake()
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():   # slot granted meanwhile
+                self.inflight -= 1
+                self._wake()
+            raise
+
+    async def release(self, latency: float, overloaded: bool = False,
+                      ok: bool = True) -> None:
+        self._rtt = 0.8 * self._rtt + 0.2 * latency
+        slow = self.latency_target is not None and latency > self.latency_target
+        if overloaded or slow:
+            self._decrease()
+        elif ok:
+            self._increase()
+        self.inflight -= 1
+        self._wake()
+
+    def pause(self, seconds: float) -> None:
+        """Honour a server `Retry-After`: hold back every new request."""
+        self._pause_until = max(self._pause_until, time.monotonic() + seconds)
+
+    def _wake(self) -> None:
+        """Admit waiters in priority order while there is room."""
+        wait = self._pause_until - time.monotonic()
+        if wait > 0:
+            if self._timer is None and self._waiters:
+                loop = asyncio.get_running_loop()
+                self._timer = loop.call_later(wait, self._on_timer)
+            return
+        while self._waiters and self.inflight < int(self.limit):
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                self.inflight += 1
+                fut.set_result(None)
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._wake()
+
+    # -- AIMD ----------------------------------------------------------------
+    def _increase(self) -> None:
+        step = 1.0 if self.slow_start else 1.0 / self.limit
+        self.limit = min(self.max_limit, self.limit + step)
+
+    def _decrease(self) -> None:
+        now = time.monotonic()
+        if now - self._last_decrease < self._rtt:    # one cut per round-trip
+            return
+        self._last_decrease = now
+        self.slow_start = False
+        self.limit = max(self.min_limit, self.limit * 0.5)
+        self.n_decreases += 1
+
+
+# ---------- error classification -------------------------------------------- #
+def _retry_after(exc) -> float | None:
+    headers = exc.response.headers
+    if "retry-after-ms" in headers:
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+def classify(exc: BaseException) -> tuple[bool, bool, float | None]:
+    """(retryable, overloaded, retry_after) for an exception from the SDK."""
+    from openai import APIConnectionError, APIStatusError, APITimeoutError
+    if isinstance(exc, APITimeoutError):
+        return True, True, None
+    if isinstance(exc, APIConnectionError):
+        return True, False, None
+    if isinstance(exc, APIStatusError):
+        status = exc.status_code
+        return (status in _RETRY_STATUS, status in _OVERLOAD_STATUS,
+                _retry_after(exc))
+    return False, False, None
+
+
+def backoff(attempt: int, base: float = 0.5, cap: float = 30.0) -> float:
+    return random.uniform(0, min(cap, base * 2 ** attempt))
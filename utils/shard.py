@@ -0,0 +1,212 @@
+"""
+Sharded execution – several workers (processes or hosts) on one input.
+
+Every worker reads the whole input (chunking and dedup included, so `idx`
+means the same row everywhere) and only dispatches the rows it owns:
+
+* HashShard("i/N")      – `Config.shard`: static partition, a row belongs
+                          to shard `blake2b(idx) mod N`
+* LeaseQueue(cfg)       – `Config.coordinator`: dynamic partition through a
+                          SQLite file all workers can reach (same host or a
+                          shared file system with working locks).  Rows are
+                          grouped in batches of `lease_rows` consecutive idx;
+                          when a worker's scan reaches a batch it leases it
+                          unless another live worker holds it or it is done.
+                          Fast workers therefore take more batches (keep
+                          `lease_rows` well above the engine's 64-row input
+                          read-ahead, or one worker grabs a run).  Leases
+                          are renewed while the worker reads input and expire
+                          after `lease_ttl`; a batch is marked done at the end
+                          of the run unless one of its rows failed, so a
+                          rerun (any worker, `resume=True`) picks up the
+                          batches of crashed workers and failed rows.
+* open_partition(cfg)   – one of the above, or None
+* shard_tag(cfg) / output_json(cfg)
+                        – every worker writes its own
+                          `<model>_<mode>.shard-<i>of<N>.jsonl` (or
+                          `.shard-<worker_id>`) plus manifest
+* merge_shards(out_json, parts)
+                        – combine shard outputs by their manifests into one
+                          JSONL + manifest in idx order; a row finished by
+                          several workers (re-leased after a crash) is kept
+                          once, a finished copy beats a failed one
+"""
+from __future__ import annotations
+import hashlib, logging, socket, sqlite3, time
+from pathlib import Path
+
+from utils.manifest import Manifest, manifest_path, FAILED
+from config import Config
+
+log = logging.getLogger(__name__)
+
+
+class HashShard:
+    def __init__(self, spec: str):
+        i, n = spec.split("/")
+        self.index, self.count = int(i), int(n)
+
+    def owns(self, idx: int) -> bool:
+        h = hashlib.blake2b(idx.to_bytes(8, "little"), digest_size=8).digest()
+        return int.from_bytes(h, "little") % self.count == self.index
+
+    def finish(self, manifest: Manifest | None = None) -> None:
+        pass
+
+
+class LeaseQueue:
+    def __init__(self, path: Path, worker: str, rows: int = 256,
+                 ttl: float = 900.0):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.worker, self.rows, self.ttl = worker, rows, ttl
+        self._db = sqlite3.connect(str(path), timeout=60,
+                                   check_same_thread=False,   # to_thread reader
+                                   isolation_level=None)
+        self._db.execute("CREATE TABLE IF NOT EXISTS leases ("
+                         " batch INTEGER PRIMARY KEY, owner TEXT NOT NULL,"
+                         " expires REAL NOT NULL, done INTEGER NOT NULL)")
+        self._owned: dict[int, bool] = {}
+        self._renewed = time.time()
+
+    def _claim(self, batch: int) -> bool:
+        now = time.time()
+        db = self._db
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            row = db.execute("SELECT owner, expires, done FROM leases"
+                             " WHERE batch = ?", (batch,)).fetchone()
+            if row is None:
+                db.execute("INSERT INTO leases VALUES (?, ?, ?, 0)",
+                           (batch, self.worker, now + self.ttl))
+                ok = True
+            elif row[2] or (row[0] != self.worker and row[1] > now):
+                ok = False                       # done, or held by a live peer
+            else:
+                db.execute("UPDATE leases SET owner = ?, expires = ?"
+                           " WHERE batch = ?", (self.worker, now + self.ttl, batch))
+                ok = True
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return ok
+
+    def _renew(self) -> None:
+        now = time.time()
+        if now - self._renewed > self.ttl / 4:
+            self._db.execute("UPDATE leases SET expires = ? WHERE owner = ?"
+                             " AND done = 0", (now + self.ttl, self.worker))
+            self._renewed = now
+
+    def owns(self, idx: int) -> bool:
+        batch = idx // self.rows
+        owned = self._owned.get(batch)
+        if owned is None:
+            owned = self._owned[batch] = self._claim(batch)
+        self._renew()
+        return owned
+
+    def finish(self, manifest: Manifest | None = None) -> None:
+        """Mark leased batches done (unless a row failed) or release them."""
+        mine = [b for b, ok in self._owned.items() if ok]
+        done, released = [], []
+        for b in mine:
+            statuses = manifest.status[b * self.rows:(b + 1) * self.rows] \
+                if manifest is not None else None
+            if statuses is not None and ord(FAILED) not in statuses:
+                done.append((b,))
+            else:
+                released.append((b,))
+        self._db.executemany("UPDATE leases SET done = 1 WHERE batch = ?", done)
+        self._db.executemany("UPDATE leases SET expires = 0 WHERE batch = ?"
+                             " AND owner = ?", [(b, self.worker) for (b,) in released])
+        self._db.close()
+        log.info("coordinator: %s batches done, %s released by %s",
+                 len(done), len(released), self.worker)
+
+
+def open_partition(cfg: Config) -> HashShard | LeaseQueue | None:
+    if cfg.shard:
+        return HashShard(cfg.shard)
+    if cfg.coordinator is not None:
+        return LeaseQueue(cfg.coordinator, cfg.worker_id or socket.gethostname(),
+                          cfg.lease_rows, cfg.lease_ttl)
+    return None
+
+
+# ---------- output naming ---------------------------------------------------- #
+def shard_tag(cfg: Config) -> str:
+    if cfg.shard:
+        i, n = cfg.shard.split("/")
+        return f".shard-{i}of{n}"
+    if cfg.coordinator is not None:
+        return f".shard-{cfg.worker_id or socket.gethostname()}"
+    return ""
+
+
+def output_json(cfg: Config, shard: bool = True) -> Path:
+    """`<output_dir>/<model>_<mode>[.shard-…].jsonl`"""
+    name = f"{cfg.model_name.replace('/','-')}_{cfg.mode.replace('-', '_')}"
+    return cfg.output_dir / f"{name}{shard_tag(cfg) if shard else ''}.jsonl"
+
+
+# ---------- merge ------------------------------------------------------------ #
+def _segments(part: Path):
+    """(idx, status, start, end) per intact manifest line of one shard."""
+    size = part.stat().st_size if part.exists() else 0
+    start = 0
+    with manifest_path(part).open("rb") as fh:
+        for line in fh:
+            fields = line.split()
+            if not line.endswith(b"\n") or len(fields) != 3:
+                break                                # torn last line
+            end = int(fields[2])
+            if end > size:
+                break                                # records never hit disk
+            yield int(fields[0]), fields[1].decode(), start, end
+            start = end
+
+
+def merge_shards(out_json: Path, parts: list[Path]) -> int:
+    """Write the union of `parts` to `out_json` (+ manifest); returns records."""
+    best: dict[int, tuple[bool, int, str, int, int]] = {}
+    for p, part in enumerate(parts):
+        covered = 0
+        for idx, status, start, end in _segments(part):
+            cand = (status != FAILED, p, status, start, end)
+            if idx not in best or (cand[0] and not best[idx][0]):
+                best[idx] = cand
+            covered = end
+        size = part.stat().st_size if part.exists() else 0
+        if size > covered:
+            log.warning("merge: %s has %s bytes past its manifest (rows never "
+                        "acknowledged, or a stale file) – they are left out; "
+                        "rerun that worker with resume to redo them",
+                        part.name, size - covered)
+
+    manifest = Manifest(out_json)                    # fresh, truncated
+    handles = [part.open("rb") for part in parts]
+    n_records, offset, mbuf = 0, 0, bytearray()
+    try:
+        with out_json.open("wb") as out:
+            for idx in sorted(best):
+                _, p, status, start, end = best[idx]
+                handles[p].seek(start)
+                data = handles[p].read(end - start)
+                out.write(data)
+                offset += len(data)
+                n_records += data.count(b"\n")
+                mbuf += manifest.entry(idx, status, offset)
+                if len(mbuf) >= 1 << 20:
+                    out.flush()                      # records before manifest
+                    manifest.write(bytes(mbuf))
+                    mbuf.clear()
+            out.flush()
+            manifest.write(bytes(mbuf), fsync=True)
+    finally:
+        for fh in handles:
+            fh.close()
+        manifest.close()
+    log.info("merge: %s rows / %s records from %s shards → %s",
+             len(best), n_records, len(parts), out_json)
+    return n_records